@@ -1,6 +1,6 @@
 use anyhow::Result;
 use axum::{
-    extract::{Path, State},
+    extract::{Path, Query, State},
     http::StatusCode,
     response::IntoResponse,
     routing::{delete, get, post},
@@ -9,7 +9,7 @@ use axum::{
 use futures::TryStreamExt;
 use mongodb::{
     bson::{doc, Bson, DateTime},
-    options::ClientOptions,
+    options::{ClientOptions, FindOptions},
     Client, Collection,
 };
 use serde::{Deserialize, Serialize};
@@ -138,6 +138,8 @@ async fn get_quantity(
 #[serde(rename_all = "camelCase")]
 struct RefundOutput {
     transaction_id: String,
+    groomer_name: String,
+    user_name: String,
 }
 
 async fn get_appointment(
@@ -152,6 +154,8 @@ async fn get_appointment(
     if let Some(user) = user {
         Ok(Json(RefundOutput {
             transaction_id: user.transaction_id,
+            groomer_name: user.groomer_name,
+            user_name: user.user_name,
         }))
     } else {
         Err(ApiError::AppointmentDoesNotExist)
@@ -175,16 +179,36 @@ async fn delete_appointment(
     }
 }
 
+#[derive(Deserialize)]
+struct Page {
+    limit: Option<u32>,
+    after: Option<String>,
+}
+
 async fn get_all_groomer_appointments(
     Path(groomer_name): Path<String>,
+    Query(page): Query<Page>,
     state: State<SharedState>,
 ) -> Result<Json<Vec<SignInOutput>>, ApiError> {
-    let filter = doc! {
+    let mut filter = doc! {
         "groomer_name": groomer_name
     };
+    // a page is ordered by id and starts after the last id of the page before it
+    let options = if page.limit.is_some() || page.after.is_some() {
+        if let Some(after) = page.after {
+            filter.insert("id", doc! {"$gt": after});
+        }
+        let options = FindOptions::builder()
+            .sort(doc! {"id": 1})
+            .limit(page.limit.map(i64::from))
+            .build();
+        Some(options)
+    } else {
+        None
+    };
     let res = state
         .appointments
-        .find(filter, None)
+        .find(filter, options)
         .await
         .map_err(|_| ApiError::InternalError)?;
     let res: Vec<_> = res
@@ -460,7 +484,7 @@ async fn get_staying_customers(
     Ok(Json(res))
 }
 
-#[derive(Deserialize, Serialize, PartialEq)]
+#[derive(Deserialize, Serialize, PartialEq, Clone, Copy)]
 #[serde(rename_all = "lowercase")]
 enum Status {
     Awaiting,
@@ -485,11 +509,20 @@ struct StatusChangeInput {
     status: Status,
 }
 
+#[derive(Serialize)]
+#[serde(rename_all = "camelCase")]
+struct StatusChangeOutput {
+    id: String,
+    groomer_name: String,
+    user_name: String,
+    status: Status,
+}
+
 async fn change_appointment_status(
     Path(appointment_id): Path<String>,
     state: State<SharedState>,
     Json(payload): Json<StatusChangeInput>,
-) -> Result<StatusCode, ApiError> {
+) -> Result<Json<StatusChangeOutput>, ApiError> {
     let filter = doc! {"id": appointment_id};
     let res = state
         .appointments
@@ -507,7 +540,12 @@ async fn change_appointment_status(
             .update_one(filter, doc! {"$set": {"status": payload.status}}, None)
             .await
             .map_err(|_| ApiError::InternalError)?;
-        Ok(StatusCode::OK)
+        Ok(Json(StatusChangeOutput {
+            id: old_appointment.id,
+            groomer_name: old_appointment.groomer_name,
+            user_name: old_appointment.user_name,
+            status: payload.status,
+        }))
     } else {
         Err(ApiError::AppointmentDoesNotExist)
     }
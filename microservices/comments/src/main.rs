@@ -1,13 +1,17 @@
 use anyhow::Result;
 use axum::{
-    extract::{Path, State},
+    extract::{Path, Query, State},
     http::StatusCode,
     response::IntoResponse,
     routing::{get, post},
     Json, Router,
 };
 use futures::TryStreamExt;
-use mongodb::{bson::doc, options::ClientOptions, Client, Collection};
+use mongodb::{
+    bson::doc,
+    options::{ClientOptions, FindOptions},
+    Client, Collection,
+};
 use serde::{Deserialize, Serialize};
 use serde_json::json;
 use std::net::SocketAddr;
@@ -112,14 +116,34 @@ struct GetOutput {
     rating: u8,
 }
 
+#[derive(Deserialize)]
+struct Page {
+    limit: Option<u32>,
+    after: Option<String>,
+}
+
 async fn get_comment(
     Path(groomer_name): Path<String>,
+    Query(page): Query<Page>,
     state: State<SharedState>,
 ) -> Result<Json<Vec<GetOutput>>, ApiError> {
-    let filter = doc! {"groomer_name": groomer_name};
+    let mut filter = doc! {"groomer_name": groomer_name};
+    // a page is ordered by id and starts after the last id of the page before it
+    let options = if page.limit.is_some() || page.after.is_some() {
+        if let Some(after) = page.after {
+            filter.insert("id", doc! {"$gt": after});
+        }
+        let options = FindOptions::builder()
+            .sort(doc! {"id": 1})
+            .limit(page.limit.map(i64::from))
+            .build();
+        Some(options)
+    } else {
+        None
+    };
     let res = state
         .db
-        .find(filter, None)
+        .find(filter, options)
         .await
         .map_err(|_| ApiError::InternalError)?;
     let res: Vec<_> = res
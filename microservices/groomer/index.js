@@ -25,6 +25,11 @@ const PetType = z.enum([
 
 const priceList = [40, 50, 60, 80, 100, 120, 160, 180, 200];
 
+const Page = z.object({
+  limit: z.coerce.number().int().positive().optional(),
+  after: z.string().optional(),
+});
+
 app.post("/create", async (req, res) => {
   const json = req.body;
   const schema = z.object({
@@ -108,6 +113,27 @@ app.get("/search/name/:name", async (req, res) => {
   }
 });
 
+app.post("/search/names", async (req, res) => {
+  const json = req.body;
+  const schema = z.object({
+    names: z.array(z.string()).max(100),
+  });
+  try {
+    const parsed = schema.parse(json);
+    const result = await Groomer.find(
+      {
+        name: { $in: parsed.names },
+      },
+      "-_id -__v"
+    ).exec();
+    res.status(200);
+    res.send(result);
+  } catch (err) {
+    res.status(400);
+    res.send({ message: "an error has occurred" });
+  }
+});
+
 app.post("/accepts/:name", async (req, res) => {
   const { name } = req.params;
   const json = req.body;
@@ -195,18 +221,22 @@ app.post("/read", async (req, res) => {
   });
   try {
     const parsed = schema.parse(json);
-    if (parsed.petType) {
-      const result = await Groomer.find(
-        { acceptedPets: parsed.petType },
-        "-_id -__v"
-      ).exec();
-      res.status(200);
-      res.send({ result });
-    } else {
-      const result = await Groomer.find({}, "-_id -__v").exec();
-      res.status(200);
-      res.send({ result });
+    const page = Page.parse(req.query);
+    const filter = parsed.petType ? { acceptedPets: parsed.petType } : {};
+    let query = Groomer.find(filter, "-_id -__v");
+    // a page is ordered by name and starts after the last name of the page before it
+    if (page.limit !== undefined || page.after !== undefined) {
+      if (page.after !== undefined) {
+        query = query.where("name").gt(page.after);
+      }
+      query = query.sort({ name: 1 });
+      if (page.limit !== undefined) {
+        query = query.limit(page.limit);
+      }
     }
+    const result = await query.exec();
+    res.status(200);
+    res.send({ result });
   } catch (err) {
     res.status(400);
     res.send({ message: "an error has occurred" });
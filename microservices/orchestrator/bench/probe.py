@@ -0,0 +1,37 @@
+"""The orchestrator app, wrapped to measure how much memory each request allocates.
+
+Only used by run.py for its sequential allocation pass, tracemalloc slows every allocation down so throughput is
+measured against the plain app. Requests are grouped by their X-Bench-Scenario header and
+GET /__bench/allocations returns, then resets, the mean peak of traced memory per request in bytes.
+"""
+import json
+import tracemalloc
+from main import app as orchestrator
+
+SCENARIO_HEADER = b"x-bench-scenario"
+
+tracemalloc.start()
+allocations: dict[str, list[int]] = {}
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        await orchestrator(scope, receive, send)
+        return
+    if scope["path"] == "/__bench/allocations":
+        body = json.dumps({scenario: sum(sizes) / len(sizes)
+                          for scenario, sizes in allocations.items()}).encode()
+        allocations.clear()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+        return
+    scenario = dict(scope["headers"]).get(SCENARIO_HEADER)
+    if scenario is None:
+        await orchestrator(scope, receive, send)
+        return
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    await orchestrator(scope, receive, send)
+    _, peak = tracemalloc.get_traced_memory()
+    allocations.setdefault(scenario.decode(), []).append(peak - before)
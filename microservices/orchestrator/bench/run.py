@@ -0,0 +1,284 @@
+"""Load test every orchestrator route against local stub upstreams.
+
+    python bench/run.py --concurrency 32 --duration 10 --latency 5,stripe=80
+    python bench/run.py --save-baseline baseline.json
+    python bench/run.py --baseline baseline.json
+
+The stubs (stubs.py), the orchestrator and this load generator each run in their own process. Every scenario reports
+requests per second, p50/p95/p99 latency, the share of failed requests and, from a second sequential pass against
+probe.py, the mean peak of memory allocated per request. Comparing against a saved baseline exits with 1 when a
+gated scenario got slower or allocates more than the tolerance allows.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from aiohttp import ClientError, ClientSession, TCPConnector
+from stubs import UPSTREAMS
+
+ORCHESTRATOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ORCHESTRATOR_DIR, "bench")
+
+PET = {"petType": "Dogs", "name": "rex", "gender": "m",
+       "age": 3, "medicalInfo": ""}
+
+# name -> (method, path, JSON body), "{i}" is replaced by a key cycling through --keyspace values so caches see misses
+SCENARIOS = {
+    "create_user": ("POST", "/user/create", {"name": "user{i}", "contactNo": "+6500000000", "email": "user@example.com"}),
+    "get_user": ("GET", "/user/read/user{i}", None),
+    "get_users": ("POST", "/user/batch", {"names": [f"user{{i}}-{n}" for n in range(30)]}),
+    "update_user": ("POST", "/user/update/user{i}", {"email": "new@example.com"}),
+    "create_groomer": ("POST", "/groomer/create", {"name": "groomer{i}", "pictureUrl": "https://example.com/groomer.png",
+                                                   "address": "1 Bench Road", "contactNo": "+6500000000", "email": "groomer@example.com",
+                                                   "petType": ["Dogs"], "basic": 40, "premium": 50, "luxury": 60}),
+    "search_groomer_by_keyword": ("GET", "/groomer/search/keyword/groomer{i}", None),
+    "get_groomer_by_name": ("GET", "/groomer/search/name/groomer{i}", None),
+    "get_groomers": ("POST", "/groomer/batch", {"names": [f"groomer{{i}}-{n}" for n in range(30)]}),
+    "delete_groomer": ("GET", "/groomer/delete/groomer{i}", None),
+    "update_groomer": ("POST", "/groomer/update/groomer{i}", {"address": "2 Bench Road"}),
+    "read_groomer": ("POST", "/groomer/read", {}),
+    "read_groomer_page": ("POST", "/groomer/read?limit=20", {}),
+    "get_comments": ("GET", "/comments/read/groomer{i}", None),
+    "get_appointments_of_user": ("GET", "/appointments/user/user{i}", None),
+    "get_arriving_customers": ("GET", "/appointments/signin/groomer{i}", None),
+    "get_staying_customers": ("GET", "/appointments/staying/groomer{i}", None),
+    "get_all_groomer_appointments": ("GET", "/appointments/groomer/groomer{i}", None),
+    "get_appointments_by_month": ("POST", "/appointments/get/groomer{i}", {"month": 1, "year": 2023}),
+    "get_groomer_dashboard": ("GET", "/groomer/dashboard/groomer{i}", None),
+    "change_appointment_status": ("POST", "/appointments/status/{i}", {"status": "staying"}),
+    "create_comment": ("POST", "/comments/create", {"groomerName": "groomer{i}", "userName": "user{i}", "title": "great",
+                                                    "message": "would come again, damn good cut", "rating": 5}),
+    "update_appointment_date": ("POST", "/appointments/update/groomer{i}", {"startDate": "2023-01-01T00:00:00.000Z",
+                                                                            "endDate": "2023-01-03T00:00:00.000Z"}),
+    "checkout": ("POST", "/checkout", {"groomerName": "groomer{i}", "pets": [PET], "startTime": "2023-01-01T00:00:00.000Z",
+                                       "endTime": "2023-01-03T00:00:00.000Z", "userName": "user{i}", "priceTier": "basic"}),
+    "refund": ("GET", "/refund/{i}", None),
+}
+
+
+def render(template, i: int):
+    if isinstance(template, str):
+        return template.replace("{i}", str(i))
+    if isinstance(template, dict):
+        return {key: render(value, i) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, i) for value in template]
+    return template
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return math.nan
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class Processes:
+    """Starts the stubs and the orchestrator, and stops them again."""
+
+    def __init__(self, args):
+        self.args = args
+        self.log = tempfile.NamedTemporaryFile(
+            "w", prefix="orchestrator-bench-", suffix=".log", delete=False)
+        self.env = {**os.environ, "PYTHONPATH": os.pathsep.join([ORCHESTRATOR_DIR, BENCH_DIR])}
+        for idx, name in enumerate(UPSTREAMS):
+            self.env[f"{name.upper()}_URL"] = f"http://127.0.0.1:{args.base_port + 1 + idx}"
+        # the full list only exists in the image, without a list comments would go to the censorer stub instead of
+        # through the in-process filter that runs in production
+        self.env.setdefault("CENSOR_WORDLIST", os.path.join(BENCH_DIR, "wordlist.txt"))
+        self.stubs = None
+        self.server = None
+
+    def start_stubs(self):
+        self.stubs = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "stubs.py"), "--base-port", str(self.args.base_port + 1),
+                                       "--latency", self.args.latency, "--jitter", str(self.args.jitter), "--error-rate", self.args.error_rate],
+                                      stdout=subprocess.PIPE, stderr=self.log, text=True)
+        if self.stubs.stdout.readline().strip() != "ready":
+            raise RuntimeError(
+                f"stub upstreams did not start, see {self.log.name}")
+
+    async def start_server(self, app: str):
+        self.server = subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(self.args.base_port),
+                                        "--log-level", "warning", "--no-access-log"],
+                                       cwd=ORCHESTRATOR_DIR, env=self.env, stdout=self.log, stderr=self.log)
+        async with ClientSession() as session:
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                if self.server.poll() is not None:
+                    break
+                try:
+                    async with session.get(f"{self.url}/healthz") as resp:
+                        if resp.ok:
+                            return
+                except OSError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"orchestrator did not start, see {self.log.name}")
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+            self.server = None
+
+    def stop(self):
+        self.stop_server()
+        if self.stubs is not None:
+            self.stubs.terminate()
+            self.stubs.wait()
+        self.log.close()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.args.base_port}"
+
+
+async def load(session: ClientSession, url: str, scenario: str, concurrency: int, duration: float, keyspace: int) -> dict:
+    method, path, body = SCENARIOS[scenario]
+    latencies = []
+    failures = 0
+    counter = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal counter, failures
+        while time.perf_counter() < deadline:
+            i = counter % keyspace
+            counter += 1
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url + render(path, i), json=render(body, i)) as resp:
+                    await resp.read()
+                    ok = resp.status < 400
+            except (OSError, ClientError, asyncio.TimeoutError):
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": failures / len(latencies) if latencies else math.nan,
+    }
+
+
+async def measure_allocations(session: ClientSession, url: str, scenarios: list[str], requests: int, keyspace: int) -> dict[str, float]:
+    for scenario in scenarios:
+        method, path, body = SCENARIOS[scenario]
+        for i in range(requests):
+            async with session.request(method, url + render(path, i % keyspace), json=render(body, i % keyspace),
+                                       headers={"X-Bench-Scenario": scenario}) as resp:
+                await resp.read()
+    async with session.get(f"{url}/__bench/allocations") as resp:
+        return await resp.json()
+
+
+def compare(results: dict, baseline: dict, gated: set[str], tolerance: float) -> list[str]:
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if base is None:
+            continue
+        checks = [("p95_ms", result["p95_ms"] > base["p95_ms"] * (1 + tolerance)),
+                  ("rps", result["rps"] < base["rps"] * (1 - tolerance))]
+        if "alloc_kib" in result and "alloc_kib" in base:
+            checks.append(
+                ("alloc_kib", result["alloc_kib"] > base["alloc_kib"] * (1 + tolerance)))
+        for metric, regressed in checks:
+            if regressed:
+                level = "REGRESSION" if scenario in gated else "warning"
+                regressions.append(
+                    f"{level}: {scenario} {metric} {base[metric]:.2f} -> {result[metric]:.2f}")
+    return regressions
+
+
+def report(results: dict):
+    header = f"{'scenario':<30}{'requests':>9}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'alloc KiB':>11}"
+    print(header)
+    print("-" * len(header))
+    for scenario, r in results.items():
+        alloc = f"{r['alloc_kib']:.1f}" if "alloc_kib" in r else "-"
+        print(f"{scenario:<30}{r['requests']:>9}{r['rps']:>10.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['error_rate']:>8.1%}{alloc:>11}")
+
+
+async def main(args) -> int:
+    scenarios = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    processes = Processes(args)
+    results = {}
+    try:
+        processes.start_stubs()
+        await processes.start_server("main:app")
+        async with ClientSession(connector=TCPConnector(limit=args.concurrency)) as session:
+            for scenario in scenarios:
+                await load(session, processes.url, scenario, args.concurrency, args.warmup, args.keyspace)
+                results[scenario] = await load(session, processes.url, scenario, args.concurrency, args.duration, args.keyspace)
+        processes.stop_server()
+        if args.alloc_requests:
+            await processes.start_server("probe:app")
+            async with ClientSession() as session:
+                allocations = await measure_allocations(session, processes.url, scenarios, args.alloc_requests, args.keyspace)
+            for scenario, size in allocations.items():
+                results[scenario]["alloc_kib"] = size / 1024
+    finally:
+        processes.stop()
+
+    report(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, set(
+            args.gate.split(",")), args.tolerance)
+        print()
+        print("\n".join(regressions) or "no regressions against the baseline")
+        if any(line.startswith("REGRESSION") for line in regressions):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="",
+                        help="comma separated, every route by default")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5,
+                        help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1,
+                        help="seconds per scenario before measuring")
+    parser.add_argument("--keyspace", type=int, default=100,
+                        help="distinct user and groomer names per scenario")
+    parser.add_argument("--alloc-requests", type=int, default=200,
+                        help="sequential requests per scenario for the allocation pass, 0 to skip it")
+    parser.add_argument("--latency", default="2,stripe=50",
+                        help="stub latency in milliseconds, e.g. 5,stripe=80")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", default="0",
+                        help="fraction of stub responses that are 500s, e.g. 0,censorer=0.05")
+    parser.add_argument("--base-port", type=int, default=18100,
+                        help="the orchestrator listens here, the stubs on the following ports")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="write the results here")
+    parser.add_argument("--gate", default="checkout,create_comment",
+                        help="scenarios whose regressions fail the run, others only warn")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative change before a metric counts as regressed")
+    sys.exit(asyncio.run(main(parser.parse_args())))
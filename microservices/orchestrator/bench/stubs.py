@@ -0,0 +1,224 @@
+"""Fake upstream services for benchmarking the orchestrator without the docker-compose stack.
+
+Every upstream listens on its own port starting at --base-port, in the order of UPSTREAMS. Latency and error rates are
+given as a default plus per-upstream overrides, e.g. `--latency 5,stripe=80 --error-rate 0,censorer=0.05`.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import graphql
+from aiohttp import web
+
+UPSTREAMS = ["user", "groomer", "appointments",
+             "comments", "stripe", "censorer"]
+
+GROOMER = {"name": "groomer", "pictureUrl": "https://example.com/groomer.png", "address": "1 Bench Road",
+           "contactNo": "+6500000000", "email": "groomer@example.com", "acceptedPets": ["Dogs", "Cats"],
+           "basic": 40, "premium": 50, "luxury": 60}
+CUSTOMER_APPOINTMENT = {"id": "1", "userName": "user", "startDate": "2023-01-01T00:00:00.000Z",
+                        "endDate": "2023-01-03T00:00:00.000Z", "pets": [{"petType": "Dogs", "name": "rex", "gender": "m", "age": 3, "medicalInfo": ""}],
+                        "priceTier": "basic", "totalPrice": 80.0}
+COMMENT = {"id": "1", "userName": "user", "title": "great",
+           "message": "would come again", "rating": 5}
+
+USER_SCHEMA = graphql.build_schema("""
+type User {
+    name: String!
+    contactNo: String!
+    email: String!
+}
+
+type Query {
+    getUser(name: String!): User
+}
+
+type Mutation {
+    createUser(name: String!, contactNo: String!, email: String!): ID!
+    updateUser(name: String!, contactNo: String, email: String): Boolean!
+}
+""")
+
+
+def parse_spec(spec: str) -> dict[str, float]:
+    """`5,stripe=80` -> a value for every upstream, 5 unless overridden."""
+    default = 0.0
+    overrides = {}
+    for item in filter(None, spec.split(",")):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            if name not in UPSTREAMS:
+                raise argparse.ArgumentTypeError(f"unknown upstream {name}")
+            overrides[name] = float(value)
+        else:
+            default = float(item)
+    return {name: overrides.get(name, default) for name in UPSTREAMS}
+
+
+def fault_injection(latency_ms: float, jitter: float, error_rate: float):
+    @web.middleware
+    async def middleware(request, handler):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000 * random.uniform(1 - jitter, 1 + jitter))
+        if error_rate and random.random() < error_rate:
+            return web.json_response({"message": "injected failure"}, status=500)
+        return await handler(request)
+    return middleware
+
+
+def user_routes(router: web.UrlDispatcher):
+    root = {
+        "getUser": lambda info, name: None if name.startswith("missing") else {"name": name, "contactNo": "+6500000000", "email": "user@example.com"},
+        "createUser": lambda info, name, contactNo, email: name,
+        "updateUser": lambda info, name, contactNo=None, email=None: True,
+    }
+    # automatic persisted queries the way the user service handles them, documents by their sha256
+    persisted = {}
+
+    async def query(request):
+        body = await request.json()
+        document = body.get("query")
+        persisted_query = (body.get("extensions") or {}).get("persistedQuery")
+        if persisted_query is not None:
+            sha256_hash = persisted_query["sha256Hash"]
+            if not document:
+                document = persisted.get(sha256_hash)
+                if document is None:
+                    return web.json_response({"errors": [{"message": "PersistedQueryNotFound"}]})
+            elif hashlib.sha256(document.encode()).hexdigest() != sha256_hash:
+                return web.json_response({"errors": [{"message": "provided sha does not match query"}]})
+            else:
+                persisted[sha256_hash] = document
+        result = await graphql.graphql(USER_SCHEMA, document, root_value=root,
+                                       variable_values=body.get("variables"))
+        res = {"data": result.data}
+        if result.errors:
+            res["errors"] = [{"message": error.message}
+                             for error in result.errors]
+        return web.json_response(res)
+
+    router.add_post("/", query)
+
+
+def groomer_routes(router: web.UrlDispatcher):
+    async def by_name(request):
+        name = request.match_info["name"]
+        if name.startswith("missing"):
+            return web.json_response({"message": "groomer not found"}, status=404)
+        return web.json_response({**GROOMER, "name": name})
+
+    async def by_names(request):
+        body = await request.json()
+        return web.json_response([{**GROOMER, "name": name} for name in body["names"] if not name.startswith("missing")])
+
+    async def read(request):
+        groomers = [{**GROOMER, "name": f"groomer{idx:02}"} for idx in range(20)]
+        if "after" in request.query:
+            groomers = [groomer for groomer in groomers if groomer["name"] > request.query["after"]]
+        if "limit" in request.query:
+            groomers = groomers[:int(request.query["limit"])]
+        return web.json_response({"result": groomers})
+
+    router.add_get("/search/name/{name}", by_name)
+    router.add_post("/search/names", by_names)
+    router.add_get("/search/keyword/{keyword}",
+                   lambda _: web.json_response([GROOMER] * 10))
+    router.add_post("/read", read)
+    router.add_post("/accepts/{name}", lambda _: web.json_response(
+        {"basic": 40, "premium": 50, "luxury": 60}))
+    router.add_post("/create", lambda _: web.Response(status=201))
+    router.add_post("/update/{name}", lambda _: web.Response())
+    router.add_get("/delete/{name}", lambda _: web.Response())
+
+
+def appointments_routes(router: web.UrlDispatcher):
+    async def of_user(request):
+        return web.json_response([{"id": str(idx), "groomerName": f"groomer{idx % 3}", "startDate": "2023-01-01T00:00:00.000Z",
+                                   "endDate": "2023-01-03T00:00:00.000Z", "petNames": ["rex"]} for idx in range(5)])
+
+    router.add_get("/user/{name}", of_user)
+    for prefix in ["signin", "staying", "groomer"]:
+        router.add_get(f"/{prefix}/{{name}}", lambda _: web.json_response(
+            [CUSTOMER_APPOINTMENT] * 5))
+    router.add_post("/get/{name}", lambda _: web.json_response(
+        [CUSTOMER_APPOINTMENT] * 5))
+    router.add_post("/status/{id}", lambda request: web.json_response(
+        {"id": request.match_info["id"], "groomerName": "groomer1", "userName": "user1", "status": "staying"}))
+    router.add_post("/update/{name}", lambda _: web.Response())
+    router.add_post("/stayed", lambda _: web.Response())
+    router.add_post(
+        "/quantity", lambda _: web.json_response({"dayLength": 2}))
+    router.add_post("/create", lambda _: web.json_response({"id": "appointment1"}))
+    router.add_get("/transaction/{id}", lambda _: web.json_response(
+        {"transactionId": "cs_test_1", "groomerName": "groomer1", "userName": "user1"}))
+    router.add_delete("/delete/{id}", lambda _: web.Response())
+
+
+def comments_routes(router: web.UrlDispatcher):
+    async def create(request):
+        body = await request.json()
+        return web.json_response({"id": "1", "title": body["title"], "message": body["message"]}, status=201)
+
+    router.add_get("/{name}", lambda _: web.json_response([COMMENT] * 10))
+    router.add_post("/", create)
+
+
+def stripe_routes(router: web.UrlDispatcher):
+    router.add_post("/create-checkout-session", lambda _: web.json_response(
+        {"checkout_url": "https://checkout.stripe.com/c/pay/cs_test_1", "id": "cs_test_1"}))
+    router.add_post("/make-refund", lambda _: web.Response(text="success"))
+
+    async def prices(request):
+        body = await request.json()
+        return web.json_response({"prices": {str(amount): f"price_{amount}" for amount in body["amounts"]}})
+
+    router.add_post("/prices", prices)
+
+
+def censorer_routes(router: web.UrlDispatcher):
+    async def censor(request):
+        body = await request.json()
+        return web.json_response({"sanitised": body["message"]})
+
+    router.add_post("/", censor)
+
+
+ROUTES = {"user": user_routes, "groomer": groomer_routes, "appointments": appointments_routes,
+          "comments": comments_routes, "stripe": stripe_routes, "censorer": censorer_routes}
+
+
+async def serve(host: str, base_port: int, latency: dict[str, float], jitter: float, error_rate: dict[str, float]):
+    runners = []
+    for idx, name in enumerate(UPSTREAMS):
+        app = web.Application(
+            middlewares=[fault_injection(latency[name], jitter, error_rate[name])])
+        ROUTES[name](app.router)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, base_port + idx).start()
+        runners.append(runner)
+    # the benchmark runner waits for this line
+    print("ready", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=18101)
+    parser.add_argument("--latency", type=parse_spec, default=parse_spec("0"),
+                        help="milliseconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="latency varies uniformly by this fraction")
+    parser.add_argument("--error-rate", type=parse_spec, default=parse_spec("0"),
+                        help="fraction of requests answered with a 500")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.base_port,
+                    args.latency, args.jitter, args.error_rate))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+import deadline
+
+
+class AsyncCache:
+    """Bounded LRU cache with a per-entry TTL for async lookups.
+
+    Concurrent `get` calls for a key that is not cached share a single call to the loader. The loader runs in a
+    context of its own, so it is not bound by the deadline or trace of whichever caller happened to start it, every
+    caller waits for it until its own deadline.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = contextvars.Context().run(asyncio.ensure_future, loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_loaded(key, t))
+        else:
+            self.coalesced += 1
+        # a caller that gets cancelled or runs out of time must not cancel the load for everyone else
+        return await deadline.wait_shared(task)
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Task):
+        failed = task.cancelled() or task.exception() is not None
+        # an invalidation while the load was in flight unregisters the task, its result is stale
+        if self._inflight.get(key) is not task:
+            return
+        del self._inflight[key]
+        if failed:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"hit": self.hits, "miss": self.misses, "coalesced": self.coalesced}
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable
+
+
+class Step:
+    """A named unit of work that runs once every step named in `after` has finished.
+
+    `run` receives the results of all finished steps keyed by step name.
+    """
+
+    def __init__(self, name: str, run: Callable[[dict[str, Any]], Awaitable[Any]], after: Iterable[str] = ()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+
+async def run_dag(steps: list[Step]) -> dict[str, Any]:
+    """Run the steps with as much concurrency as their dependencies allow.
+
+    The first step to fail cancels every step that is still running and its exception is re-raised.
+    """
+    results: dict[str, Any] = {}
+    waiting = {step.name: step for step in steps}
+    running: dict[asyncio.Task, Step] = {}
+    try:
+        while waiting or running:
+            for name, step in list(waiting.items()):
+                if all(dep in results for dep in step.after):
+                    del waiting[name]
+                    running[asyncio.create_task(step.run(results))] = step
+            if not running:
+                raise ValueError(
+                    f"steps {sorted(waiting)} have missing or circular dependencies")
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            failures = [task.exception() for task in done if task.exception() is not None]
+            if failures:
+                raise failures[0]
+            for task in done:
+                results[running.pop(task).name] = task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    return results
+
+
+async def gather(*aws: Awaitable[Any]) -> list[Any]:
+    """Like `asyncio.gather`, but the first failure cancels the awaitables that are still running before it is raised.
+
+    These are the semantics of `asyncio.TaskGroup`, which only exists from Python 3.11 on.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    # every failure is retrieved, not only the one raised, or asyncio logs the others as never retrieved, the
+    # cancelled tasks were retrieved by gather above
+    errors = [task.exception()
+              for task in tasks if task in done and not task.cancelled()]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [task.result() for task in tasks]
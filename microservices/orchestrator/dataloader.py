@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Hashable
+import deadline
+
+
+class DataLoader:
+    """Collects every key requested during one event loop iteration and resolves them with one batch call.
+
+    `batch_load` receives a list of unique keys and returns a mapping from key to value, keys that are
+    missing from the mapping resolve to None. A batch serves several requests and runs in a context of its own, not
+    under the deadline or trace of the first one.
+    """
+
+    def __init__(self, batch_load: Callable[[list], Awaitable[dict[Hashable, Any]]], max_batch_size: int = 50):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self._pending: dict[Hashable, asyncio.Future] = {}
+        # the event loop only keeps weak references to tasks
+        self._running: set[asyncio.Task] = set()
+
+    def load(self, key: Hashable) -> Awaitable[Any]:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                loop.call_soon(self._dispatch, context=contextvars.Context())
+            future = loop.create_future()
+            self._pending[key] = future
+        # callers share the future, one of them being cancelled or out of time must not cancel it for the rest
+        return deadline.wait_shared(future)
+
+    async def load_many(self, keys: list[Hashable]) -> list[Any]:
+        return await asyncio.gather(*[self.load(key) for key in keys])
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = {key: pending[key]
+                     for key in keys[start:start + self.max_batch_size]}
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: dict[Hashable, asyncio.Future]):
+        try:
+            results = await self.batch_load(list(batch))
+        except asyncio.CancelledError:
+            # nobody would ever resolve the futures otherwise and their callers would wait forever
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
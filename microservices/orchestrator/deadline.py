@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+from fastapi import Request
+from starlette.datastructures import Headers
+
+# milliseconds left to answer, accepted from callers and sent to upstreams
+HEADER = "X-Request-Timeout-Ms"
+DEFAULT_BUDGET = float(os.getenv("REQUEST_BUDGET", "10"))
+
+_started: ContextVar[Optional[float]] = ContextVar("started", default=None)
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    def __init__(self):
+        super().__init__("deadline exceeded")
+
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(limit: float) -> float:
+    """Timeout for a call that may take `limit` seconds on its own, raises DeadlineExceeded once nothing is left."""
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise DeadlineExceeded
+    return min(limit, left)
+
+
+async def wait_shared(aw: Awaitable) -> Any:
+    """Wait for work shared with other requests until this request's deadline, without cancelling the work itself."""
+    shielded = asyncio.shield(aw)
+    try:
+        left = remaining()
+        if left is None:
+            return await shielded
+        done, _ = await asyncio.wait([shielded], timeout=max(0.0, left))
+        if not done:
+            raise DeadlineExceeded
+        return shielded.result()
+    finally:
+        # shield marks the work's outcome as retrieved once nobody waits for it anymore
+        if not shielded.done():
+            shielded.cancel()
+
+
+def header(seconds: float) -> dict[str, str]:
+    return {HEADER: str(max(1, int(seconds * 1000)))}
+
+
+def _requested(headers: Headers) -> float:
+    try:
+        return max(0.0, float(headers[HEADER]) / 1000)
+    except (KeyError, ValueError):
+        return float("inf")
+
+
+def budget(seconds: float) -> Callable:
+    """Dependency giving a route `seconds` from the arrival of the request instead of DEFAULT_BUDGET."""
+    async def set_budget(request: Request):
+        started = _started.get() or time.monotonic()
+        _deadline.set(started + min(seconds, _requested(request.headers)))
+    return set_budget
+
+
+@contextmanager
+def within(seconds: Optional[float]) -> Iterator[None]:
+    """Run the block with its own deadline, or none at all, like background work that outlives its request."""
+    token = _deadline.set(
+        None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """Gives every request DEFAULT_BUDGET seconds, or less when the caller sends its own in HEADER."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        now = time.monotonic()
+        started = _started.set(now)
+        token = _deadline.set(
+            now + min(DEFAULT_BUDGET, _requested(Headers(scope=scope))))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+            _started.reset(started)
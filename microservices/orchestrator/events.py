@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+import pika
+from publisher import call, open_channel, open_connection
+
+logger = logging.getLogger(__name__)
+
+
+def appointment_event(kind: str, appointment_id: str, groomer_name: str, user_name: str, **fields) -> dict:
+    return {"id": uuid.uuid4().hex, "type": kind, "appointmentId": appointment_id, "groomerName": groomer_name,
+            "userName": user_name, "at": datetime.now(timezone.utc).isoformat(), **fields}
+
+
+def invalidation_event(groomers: Iterable[str] = (), users: Iterable[str] = (), tags: Iterable[str] = ()) -> dict:
+    return {"groomers": list(groomers), "users": list(users), "tags": list(tags)}
+
+
+def encode(event: dict) -> str:
+    return json.dumps(event)
+
+
+class EventHub:
+    """Fans events out to the subscribers of their topic within this process.
+
+    Every subscriber gets a bounded queue. One that falls behind is sent None and dropped, so a slow client never
+    holds up the others and reconnects instead. The last `history` events are kept to replay what a reconnecting
+    client missed, they also make publishing the same event twice a no-op.
+    """
+
+    def __init__(self, queue_size: int = 100, history: int = 1000):
+        self.queue_size = queue_size
+        self.history = history
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._events: OrderedDict[str, tuple[str, dict]] = OrderedDict()
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(topic)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[topic]
+
+    def publish(self, topic: str, event: dict) -> bool:
+        """Deliver `event` unless it was already delivered, returns whether it was."""
+        if event["id"] in self._events:
+            return False
+        self._events[event["id"]] = (topic, event)
+        while len(self._events) > self.history:
+            self._events.popitem(last=False)
+        for queue in list(self._subscribers.get(topic, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.unsubscribe(topic, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        return True
+
+    def missed(self, topic: str, last_event_id: Optional[str]) -> list[dict]:
+        """Events of `topic` after `last_event_id`, nothing if that event is unknown or too old."""
+        if last_event_id is None or last_event_id not in self._events:
+            return []
+        missed = []
+        found = False
+        for event_id, (event_topic, event) in self._events.items():
+            if found and event_topic == topic:
+                missed.append(event)
+            found = found or event_id == last_event_id
+        return missed
+
+
+class BrokerListener:
+    """Passes every event published to `exchange_name` with a key matching `routing_key` to `on_event`.
+
+    Each process listens on an exclusive queue of its own, so events published by any orchestrator process reach
+    the clients connected to all of them. Like the publisher it reconnects in the background with exponential backoff.
+    """
+
+    def __init__(self, parameters: pika.ConnectionParameters, exchange_name: str, exchange_type: str, routing_key: str,
+                 on_event: Callable[[dict], None], connect_timeout: float = 10, min_backoff: float = 0.5, max_backoff: float = 30):
+        self.parameters = parameters
+        self.exchange_name = exchange_name
+        self.exchange_type = exchange_type
+        self.routing_key = routing_key
+        self.on_event = on_event
+        self.connect_timeout = connect_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._task: Optional[asyncio.Task] = None
+        self._connection = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        backoff = self.min_backoff
+        try:
+            while True:
+                closed = asyncio.get_running_loop().create_future()
+                try:
+                    await asyncio.wait_for(self._listen(closed), self.connect_timeout)
+                    backoff = self.min_backoff
+                    await closed
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.warning("rabbitmq listener disconnected: %r", exc)
+                self._teardown()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            self._teardown()
+
+    async def _listen(self, closed: asyncio.Future):
+        self._connection = await open_connection(self.parameters)
+
+        def on_closed(_, exc):
+            if not closed.done():
+                closed.set_exception(ConnectionError(
+                    f"connection closed: {exc!r}"))
+
+        self._connection.add_on_close_callback(on_closed)
+        channel = await open_channel(self._connection)
+        await call(channel.exchange_declare, exchange=self.exchange_name,
+                   exchange_type=self.exchange_type, durable=True)
+        # a server named queue that goes away with the connection, events missed while disconnected are not replayed
+        frame = await call(channel.queue_declare, queue="", exclusive=True, auto_delete=True)
+        queue = frame.method.queue
+        await call(channel.queue_bind, queue=queue,
+                   exchange=self.exchange_name, routing_key=self.routing_key)
+        channel.basic_consume(queue, self._on_message, auto_ack=True)
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            self.on_event(json.loads(body))
+        except Exception:
+            logger.exception("dropping malformed event from %s",
+                             method.routing_key)
+
+    def _teardown(self):
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            self._connection.close()
+        self._connection = None
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import compile_path
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+# larger responses are sent as they come, without an ETag and without being cached
+RESPONSE_CACHE_MAX_BODY = int(
+    os.getenv("RESPONSE_CACHE_MAX_BODY", str(1024 * 1024)))
+
+
+class CachePolicy:
+    """Caching rules for the GET route with this path template.
+
+    `tags` are formatted with the route's path parameters, invalidating any of them drops the cached responses.
+    """
+
+    def __init__(self, path: str, cache_control: str, tags: Iterable[str] = (), ttl: float = RESPONSE_CACHE_TTL):
+        self.path = path
+        self.cache_control = cache_control
+        self.tags = tuple(tags)
+        self.ttl = ttl
+        self.regex, _, _ = compile_path(path)
+
+    def match(self, path: str) -> Optional[list[str]]:
+        match = self.regex.match(path)
+        if match is None:
+            return None
+        params = match.groupdict()
+        return [tag.format(**params) for tag in self.tags]
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "etag", "tags")
+
+    def __init__(self, status: int, headers: list[tuple[bytes, bytes]], body: bytes, tags: list[str]):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.tags = tags
+
+
+class ResponseCache:
+    """Bounded LRU cache of whole responses with a per-entry TTL, invalidated by tag.
+
+    It is per process, a write only invalidates the worker that handled it, the others serve their copy until it
+    expires, which is why the TTLs are kept short.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple[float, CachedResponse]] = OrderedDict()
+        self._keys_by_tag: dict[str, set] = {}
+        # bumped by every invalidation, a response computed while it changed may be stale and is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, response: CachedResponse, ttl: float, generation: int):
+        if generation != self.generation:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, response)
+        for tag in response.tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1].tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, *tags: str):
+        self.generation += 1
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._remove(key)
+
+    def stats(self) -> dict[str, int]:
+        return {"hit": self.hits, "miss": self.misses, "not_modified": self.not_modified}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate[2:] if candidate.startswith("W/") else candidate
+                                         for candidate in candidates]
+
+
+class HttpCacheMiddleware:
+    """Adds ETag and Cache-Control headers to the GET routes that have a CachePolicy and answers If-None-Match.
+
+    Successful JSON responses of those routes are kept in `cache`. Responses that are not 200, are streamed as
+    NDJSON or are larger than RESPONSE_CACHE_MAX_BODY go straight to the client with only the Cache-Control header.
+    """
+
+    def __init__(self, app, cache: ResponseCache, policies: list[CachePolicy]):
+        self.app = app
+        self.cache = cache
+        self.policies = policies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        for policy in self.policies:
+            tags = policy.match(scope["path"])
+            if tags is not None:
+                break
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match")
+        key = (scope["path"], scope["query_string"],
+               request_headers.get("accept", ""))
+        cached = self.cache.get(key)
+        if cached is not None:
+            await self._send(send, cached, policy, if_none_match)
+            return
+
+        generation = self.cache.generation
+        start = None
+        chunks = []
+        size = 0
+        streaming = False
+
+        async def capture(message):
+            nonlocal start, size, streaming
+            if streaming:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                headers = MutableHeaders(scope=message)
+                if message["status"] != 200 or "application/x-ndjson" in headers.get("content-type", ""):
+                    streaming = True
+                    if message["status"] == 200:
+                        headers["Cache-Control"] = policy.cache_control
+                        headers["Vary"] = "Accept"
+                    await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > RESPONSE_CACHE_MAX_BODY:
+                streaming = True
+                headers = MutableHeaders(scope=start)
+                headers["Cache-Control"] = policy.cache_control
+                headers["Vary"] = "Accept"
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks),
+                            "more_body": message.get("more_body", False)})
+
+        await self.app(scope, receive, capture)
+        if streaming or start is None:
+            return
+        response = CachedResponse(
+            start["status"], start["headers"], b"".join(chunks), tags)
+        self.cache.set(key, response, policy.ttl, generation)
+        await self._send(send, response, policy, if_none_match)
+
+    async def _send(self, send, response: CachedResponse, policy: CachePolicy, if_none_match: Optional[str]):
+        headers = MutableHeaders(raw=list(response.headers))
+        headers["ETag"] = response.etag
+        headers["Cache-Control"] = policy.cache_control
+        headers["Vary"] = "Accept"
+        if if_none_match and _etag_matches(if_none_match, response.etag):
+            self.cache.not_modified += 1
+            del headers["content-length"]
+            del headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers["Content-Length"] = str(len(response.body))
+        await send({"type": "http.response.start", "status": response.status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": response.body})
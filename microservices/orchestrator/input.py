@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist
 from enum import Enum
 from output import Pet
 
@@ -15,6 +15,10 @@ class PetType(str, Enum):
     fishes = "Fishes"
 
 
+class Names(BaseModel):
+    names: conlist(str, max_items=100)
+
+
 class CreateUser(BaseModel):
     name: str
     contactNo: str
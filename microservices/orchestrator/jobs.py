@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("id", "status", "result", "error", "finished_at", "changed")
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "pending"
+        self.result: Any = None
+        self.error: Optional[dict] = None
+        self.finished_at: Optional[float] = None
+        # set and replaced on every status change, waiters take it before reading the status
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def _update(self, status: str, result: Any = None, error: Optional[dict] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if self.done:
+            self.finished_at = time.monotonic()
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def view(self) -> dict:
+        return {"jobId": self.id, "status": self.status, "result": self.result, "error": self.error}
+
+    @classmethod
+    def restore(cls, job_id: str, status: str, result: Any, error: Optional[dict]) -> "Job":
+        job = cls()
+        job.id = job_id
+        job.status = status
+        job.result = result
+        job.error = error
+        return job
+
+
+class JobStore:
+    """Job states in a SQLite file shared by the worker processes of one host.
+
+    A job can then be polled on any worker, not only the one running it. The connection is opened on first use, so
+    a store created before the workers fork is not shared between them. Queries run on one thread of their own, off
+    the event loop and in the order they were made.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._db: Optional[sqlite3.Connection] = None
+        self._expired_at = 0.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="job-store")
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None)
+            # every query is a single small row, WAL without fsync on commit keeps them well under a millisecond
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                             "result TEXT, error TEXT, updated_at REAL NOT NULL)")
+        return self._db
+
+    async def _run(self, query: Callable[[], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, query)
+
+    async def save(self, job: Job):
+        # the row is taken now, the job may change before the query runs
+        row = (job.id, job.status, json.dumps(job.result),
+               json.dumps(job.error), time.time())
+        await self._run(lambda: self.db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?)", row))
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        row = await self._run(lambda: self.db.execute("SELECT status, result, error FROM jobs WHERE id = ?",
+                                                      (job_id,)).fetchone())
+        if row is None:
+            return None
+        status, result, error = row
+        return Job.restore(job_id, status, json.loads(result), json.loads(error))
+
+    async def expire(self):
+        # rows only need to go eventually, not on every lookup
+        if time.monotonic() - self._expired_at < 60:
+            return
+        self._expired_at = time.monotonic()
+        await self._run(lambda: self.db.execute("DELETE FROM jobs WHERE updated_at < ?",
+                                                (time.time() - self.ttl,)))
+
+
+class JobRunner:
+    """Runs submitted coroutines on a fixed number of worker tasks, keeping their outcome for `ttl` seconds.
+
+    At most `max_pending` jobs wait for a worker, `submit` raises JobQueueFull beyond that. Jobs run in the process
+    that accepted them, with `store_path` their state is also written to a JobStore that the other processes read.
+    A job that raises an HTTPException fails with its status code and detail, anything else fails with a 500.
+    """
+
+    # how often a job running in another process is checked for changes
+    poll_interval = 0.5
+
+    def __init__(self, workers: int = 16, max_pending: int = 200, ttl: float = 900, maxsize: int = 10000,
+                 store_path: Optional[str] = None):
+        self.workers = workers
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.store = JobStore(store_path, ttl) if store_path else None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work())
+                       for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, run: Callable[[], Awaitable[Any]]) -> Job:
+        if self._queue.full():
+            raise JobQueueFull
+        job = Job()
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, run))
+        # saved before a worker takes the job, its pending row is written before the running one
+        await self._save(job)
+        await self._expire()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """The job itself if it runs in this process, a snapshot of it if it runs in another one."""
+        await self._expire()
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await self.store.load(job_id)
+        return job
+
+    async def watch(self, job_id: str, keepalive: float) -> AsyncIterator[Optional[Job]]:
+        """Yield the job now and after every change until it is done, or None after `keepalive` seconds without one."""
+        status = None
+        idle = 0.0
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            changed = job.changed
+            if job.status != status:
+                status = job.status
+                idle = 0.0
+                yield job
+            if job.done:
+                return
+            if job_id in self._jobs:
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                    continue
+                except asyncio.TimeoutError:
+                    idle = keepalive
+            else:
+                await asyncio.sleep(self.poll_interval)
+                idle += self.poll_interval
+            if idle >= keepalive:
+                idle = 0.0
+                yield None
+
+    async def _save(self, job: Job):
+        if self.store is not None:
+            await self.store.save(job)
+
+    async def _expire(self):
+        now = time.monotonic()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            finished = job.finished_at is not None and now - job.finished_at > self.ttl
+            # past maxsize the oldest jobs go even if nobody asked for their outcome yet
+            if not finished and len(self._jobs) <= self.maxsize:
+                break
+            del self._jobs[job.id]
+        if self.store is not None:
+            await self.store.expire()
+
+    async def _work(self):
+        while True:
+            job, run = await self._queue.get()
+            job._update("running")
+            await self._save(job)
+            try:
+                result = await run()
+            except HTTPException as e:
+                job._update("failed", error={
+                            "status": e.status_code, "detail": e.detail})
+            except Exception:
+                logger.exception("job %s failed", job.id)
+                job._update("failed", error={
+                            "status": 500, "detail": "internal server error"})
+            else:
+                job._update("succeeded", result=result)
+            await self._save(job)
@@ -0,0 +1,118 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, Optional
+from aiohttp import StreamReader
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = WHITESPACE + ",]}"
+_decoder = json.JSONDecoder()
+
+
+class ArrayDecoder:
+    """Decodes the items of a JSON array while its text is still arriving.
+
+    The array is either the whole document or, with `key`, the value of that member of a top-level object. Only the
+    item being decoded is buffered, so memory does not grow with the length of the array.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.done = False
+        self._state = "object" if key is not None else "array"
+        self._text = ""
+        self._pos = 0
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, data: bytes, final: bool = False) -> list:
+        """Return the items completed by `data`, `final` marks the end of the document."""
+        self._text = self._text[self._pos:] + self._utf8.decode(data, final)
+        self._pos = 0
+        items = []
+        while not self.done and self._step(items, final):
+            pass
+        if final and not self.done:
+            raise ValueError("JSON document ended before the array did")
+        return items
+
+    def _skip_whitespace(self) -> bool:
+        text, pos = self._text, self._pos
+        while pos < len(text) and text[pos] in WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos < len(text)
+
+    def _value(self, final: bool) -> tuple[bool, Any]:
+        try:
+            value, end = _decoder.raw_decode(self._text, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return False, None
+        # a number is only complete once a delimiter follows it, more of it may still be on the way
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and not final and \
+                (end == len(self._text) or self._text[end] not in DELIMITERS):
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _expect(self, char: str):
+        if self._text[self._pos] != char:
+            raise ValueError(
+                f"expected {char!r} at {self._text[self._pos:self._pos + 20]!r}")
+        self._pos += 1
+
+    def _step(self, items: list, final: bool) -> bool:
+        """Advance by one token or value, False when more text is needed."""
+        if not self._skip_whitespace():
+            return False
+        state = self._state
+        if state == "object":
+            self._expect("{")
+            self._state = "member"
+        elif state == "member":
+            if self._text[self._pos] == "}":
+                raise ValueError(f"the document has no {self.key!r} member")
+            if self._text[self._pos] == ",":
+                self._pos += 1
+                return True
+            start = self._pos
+            complete, name = self._value(final)
+            if not complete or not self._skip_whitespace():
+                self._pos = start
+                return False
+            self._expect(":")
+            self._state = "array" if name == self.key else "skip"
+        elif state == "skip":
+            complete, _ = self._value(final)
+            if not complete:
+                return False
+            self._state = "member"
+        elif state == "array":
+            self._expect("[")
+            self._state = "first"
+        elif state in ("first", "item"):
+            if self._text[self._pos] == "]":
+                self._pos += 1
+                self.done = True
+                return True
+            if state == "item":
+                self._expect(",")
+                self._state = "first"
+                return True
+            complete, value = self._value(final)
+            if not complete:
+                return False
+            items.append(value)
+            self._state = "item"
+        return True
+
+
+async def iter_array(content: StreamReader, key: Optional[str] = None) -> AsyncIterator[Any]:
+    decoder = ArrayDecoder(key)
+    async for chunk in content.iter_any():
+        for item in decoder.feed(chunk):
+            yield item
+        if decoder.done:
+            return
+    for item in decoder.feed(b"", final=True):
+        yield item
@@ -1,16 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 import input
 import output
-from aiographql.client import GraphQLClient
-from aiohttp import ClientSession, ClientTimeout
+import profanity
 from typing import Optional
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import os
 import pika
-import time
+from publisher import Publisher
 import asyncio
-from async_lru import alru_cache
-
-time.sleep(9)
+from cache import AsyncCache
+from dataloader import DataLoader
+from dag import Step, gather, run_dag
+from upstreams import UPSTREAMS, CircuitOpenError, UpstreamClient
+from proxy import MAX_PAGE_SIZE, listing, passthrough, wants_ndjson
+import metrics
+import tracing
+import httpcache
+import sse
+import events
+import deadline
+import operations
+from jobs import JobQueueFull, JobRunner
+from aiohttp import ClientError
+from fastapi.responses import PlainTextResponse
 
 # Making an API gateway-like microservice is not our initial intention, but it is our goal to provide user-friendly API docs in a single place
 # Hence, the advantages of using an actual API gateway like Kong quickly becomes more murky
@@ -18,87 +32,161 @@ time.sleep(9)
 hostname = "esd-rabbit"
 port = 5672
 
-connection = pika.BlockingConnection(
-    pika.ConnectionParameters(host=hostname, port=port,
-                              heartbeat=3600, blocked_connection_timeout=3600)
-)
-
-channel = connection.channel()
 exchange_name = "main"
 exchange_type = "topic"
-channel.exchange_declare(exchange=exchange_name,
-                         exchange_type=exchange_type, durable=True)
-
 queue_name = "sms"
-channel.queue_declare(queue=queue_name, durable=True)
-
-channel.queue_bind(exchange=exchange_name,
-                   queue=queue_name, routing_key="sms.*")
-
-channel.basic_publish(exchange=exchange_name, routing_key="sms.user",
-                      body="+6581650034", properties=pika.BasicProperties(delivery_mode=2))
-
 
-graphql_client = GraphQLClient(
-    endpoint="http://user:5000/"
-)
+# nothing below opens a connection or binds to an event loop at import, the publisher, listener and job runner only
+# start in lifespan, so every worker process owns its own
+rabbitmq_parameters = pika.ConnectionParameters(host=hostname, port=port, heartbeat=3600,
+                                                blocked_connection_timeout=3600)
+publisher = Publisher(rabbitmq_parameters, exchange_name,
+                      exchange_type, bindings={queue_name: "sms.*"})
 
 
-# HTTP client singleton
+# HTTP client registry, one client per upstream service, built in lifespan by each worker process
 class HttpClient:
-    aiohttp_client: Optional[ClientSession] = None
+    clients: dict[str, UpstreamClient] = {}
 
     @classmethod
-    def get_client(cls) -> ClientSession:
-        if cls.aiohttp_client is None:
-            cls.aiohttp_client = ClientSession(timeout=ClientTimeout(total=9))
-        return cls.aiohttp_client
+    def open(cls):
+        cls.clients = {name: UpstreamClient(upstream)
+                       for name, upstream in UPSTREAMS.items()}
+
+    @classmethod
+    def get_client(cls, upstream: str) -> UpstreamClient:
+        return cls.clients[upstream]
 
     @classmethod
     async def close(cls):
-        if cls.aiohttp_client is not None:
-            await cls.aiohttp_client.close()
+        for client in cls.clients.values():
+            await client.close()
+        cls.clients = {}
+
+
+# checkouts submitted as jobs run here, the queue bounds how many can wait for Stripe at once
+checkout_jobs = JobRunner(workers=int(os.getenv("CHECKOUT_WORKERS", "16")),
+                          max_pending=int(
+                              os.getenv("CHECKOUT_QUEUE_SIZE", "200")),
+                          ttl=float(os.getenv("CHECKOUT_JOB_TTL", "900")),
+                          # set by serve.py when it runs several workers, any of them can then answer for a job
+                          store_path=os.getenv("CHECKOUT_JOB_DB"))
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
+    HttpClient.open()
+    # connects in the background with backoff, /readyz reports when it is up
+    publisher.start()
+    appointment_listener.start()
+    invalidation_listener.start()
+    loop_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+    checkout_jobs.start()
     yield
+    await checkout_jobs.stop()
+    loop_monitor.cancel()
+    await appointment_listener.close()
+    await invalidation_listener.close()
+    await publisher.close()
     await HttpClient.close()
 
 app = FastAPI(lifespan=lifespan, root_path="/backend")
+# must be set before any route is declared
+app.router.route_class = metrics.InstrumentedRoute
+# personal data is only cached by the client, no-cache routes are revalidated through their ETag on every request
+response_cache = httpcache.ResponseCache(maxsize=2048)
+app.add_middleware(httpcache.HttpCacheMiddleware, cache=response_cache, policies=[
+    httpcache.CachePolicy("/user/read/{name}", "private, max-age=10",
+                          ["user:{name}"]),
+    httpcache.CachePolicy("/groomer/search/keyword/{keyword}", "public, max-age=30",
+                          ["groomers"]),
+    httpcache.CachePolicy("/groomer/search/name/{name}", "public, max-age=30",
+                          ["groomer:{name}"]),
+    httpcache.CachePolicy("/comments/read/{groomer_name}", "public, max-age=10",
+                          ["comments:{groomer_name}"]),
+    httpcache.CachePolicy("/appointments/user/{user_name}", "private, no-cache",
+                          ["appointments", "user-appointments:{user_name}", "groomers"]),
+    httpcache.CachePolicy("/appointments/signin/{groomer_name}", "private, no-cache",
+                          ["appointments", "appointments:{groomer_name}"]),
+    httpcache.CachePolicy("/appointments/staying/{groomer_name}", "private, no-cache",
+                          ["appointments", "appointments:{groomer_name}"]),
+    httpcache.CachePolicy("/appointments/groomer/{groomer_name}", "private, no-cache",
+                          ["appointments", "appointments:{groomer_name}"]),
+    httpcache.CachePolicy("/groomer/dashboard/{groomer_name}", "private, no-cache",
+                          ["appointments", "appointments:{groomer_name}", "groomer:{groomer_name}", "comments:{groomer_name}"]),
+])
+# added last so it wraps the cache and times cached responses too
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(deadline.DeadlineMiddleware)
 
+# appointment changes go out on the exchange, every orchestrator process hears them back and pushes them to the
+# front desk screens of the groomer connected to it
+appointment_events = events.EventHub()
 
-async def does_groomer_exist(name: str) -> bool:
-    async with HttpClient.get_client().get(f"http://groomer:5000/search/name/{name}") as resp:
-        if resp.ok:
-            return True
-        else:
-            return False
 
+def deliver_appointment_event(event: dict):
+    if appointment_events.publish(event["groomerName"], event):
+        # an event concerns one groomer and one customer, listings of everyone else stay cached
+        response_cache.invalidate(
+            f"appointments:{event['groomerName']}", f"user-appointments:{event['userName']}")
 
-async def does_user_exist(name: str) -> bool:
-    query = """
-    query {{
-        getUser(name: "{name}") {{
-            name,
-            contactNo,
-            email
-        }}
-    }}
-    """.format(name=name)
-    res = await graphql_client.query(query)
-    res = res.json["data"]["getUser"]
-    if res == None:
-        return False
-    return True
+
+def publish_appointment_event(kind: str, appointment_id: str, groomer_name: str, user_name: str, **fields):
+    event = events.appointment_event(
+        kind, appointment_id, groomer_name, user_name, **fields)
+    # subscribers of this process get it right away, the copy coming back from the broker is a duplicate
+    deliver_appointment_event(event)
+    publisher.publish(f"appointment.{kind}", events.encode(event))
+
+
+appointment_listener = events.BrokerListener(rabbitmq_parameters, exchange_name, exchange_type, "appointment.*",
+                                             deliver_appointment_event)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if not publisher.connected:
+        return JSONResponse(status_code=503, content={"status": "waiting for rabbitmq"})
+    return {"status": "ok"}
+
+
+@app.get("/debug/slow-requests", include_in_schema=False)
+async def get_slow_requests():
+    return list(tracing.slow_requests)
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(_: Request, exc: CircuitOpenError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.exception_handler(deadline.DeadlineExceeded)
+async def deadline_exceeded_handler(_: Request, exc: deadline.DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 
 class UtilError(Exception):
     pass
 
 
+# CENSOR_MODE=remote sends every text to the censorer service instead
+profanity_filter = profanity.from_env()
+
+
 async def censor(text: str) -> str:
-    async with HttpClient.get_client().post(f"http://censorer:5000", json={"message": text}) as resp:
+    if profanity_filter is not None:
+        return profanity_filter.clean(text)
+    async with HttpClient.get_client("censorer").post("/", json={"message": text}) as resp:
         json = await resp.json()
         if resp.ok:
             return json["sanitised"]
@@ -106,46 +194,118 @@ async def censor(text: str) -> str:
             raise UtilError
 
 
-@alru_cache(ttl=5)
-async def get_groomer_picture_url(name: str) -> str:
-    async with HttpClient.get_client().get(f"http://groomer:5000/search/name/{name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json["pictureUrl"]
-        else:
+groomer_cache = AsyncCache(maxsize=1024, ttl=30)
+user_cache = AsyncCache(maxsize=1024, ttl=30)
+metrics.track_caches({"groomer": groomer_cache, "user": user_cache,
+                      "response": response_cache})
+
+
+def apply_invalidation(event: dict):
+    for name in event["groomers"]:
+        groomer_cache.invalidate(name)
+    for name in event["users"]:
+        user_cache.invalidate(name)
+    response_cache.invalidate(*event["tags"])
+
+
+def invalidate(groomers: tuple[str, ...] = (), users: tuple[str, ...] = (), tags: tuple[str, ...] = ()):
+    """Drop cached groomers, users and responses in every orchestrator process, not only the one that made a change."""
+    event = events.invalidation_event(groomers, users, tags)
+    # this process drops them right away, the copy coming back from the broker drops them again
+    apply_invalidation(event)
+    publisher.publish("cache.invalidate", events.encode(event))
+
+
+invalidation_listener = events.BrokerListener(rabbitmq_parameters, exchange_name, exchange_type, "cache.invalidate",
+                                              apply_invalidation)
+
+
+async def graphql_query(operation: operations.Operation, variables: dict) -> dict:
+    res = await graphql_send(operation.payload(variables))
+    if operations.not_persisted(res):
+        # first use since the user service started, it learns the document from this request
+        res = await graphql_send(operation.payload(variables, persisted=False))
+    return res
+
+
+async def graphql_send(payload: dict) -> dict:
+    async with HttpClient.get_client("user").post("/", json=payload) as resp:
+        if not resp.ok:
+            raise UtilError
+        return await resp.json()
+
+
+async def load_groomers(names: list[str]) -> dict[str, Optional[dict]]:
+    # every groomer requested during this tick is fetched with one query
+    async with HttpClient.get_client("groomer").post("/search/names", hedge=True, json={"names": names}) as resp:
+        if not resp.ok:
             raise UtilError
+        groomers = await resp.json()
+    return {groomer["name"]: groomer for groomer in groomers}
+
+
+groomer_loader = DataLoader(load_groomers)
+
+
+async def get_groomer(name: str) -> Optional[dict]:
+    # the shared load runs outside of every request's trace, each caller records how long it waited for it
+    with tracing.span("groomer", f"getGroomer {name}"):
+        return await groomer_cache.get(name, lambda: groomer_loader.load(name))
+
+
+async def load_users(names: list[str]) -> dict[str, Optional[dict]]:
+    # a single aliased document resolves every user requested during this tick
+    res = await graphql_query(operations.get_users(len(names)),
+                              {f"n{idx}": name for idx, name in enumerate(names)})
+    data = res["data"]
+    if data == None:
+        raise UtilError
+    return {name: data[f"u{idx}"] for idx, name in enumerate(names)}
+
+
+user_loader = DataLoader(load_users)
+
+
+async def get_user_info(name: str) -> Optional[dict]:
+    with tracing.span("user", f"getUser {name}"):
+        return await user_cache.get(name, lambda: user_loader.load(name))
+
+
+async def does_groomer_exist(name: str) -> bool:
+    try:
+        return await get_groomer(name) != None
+    except UtilError:
+        return False
+
+
+async def does_user_exist(name: str) -> bool:
+    return await get_user_info(name) != None
+
+
+async def get_groomer_picture_url(name: str) -> str:
+    groomer = await get_groomer(name)
+    if groomer == None:
+        raise UtilError
+    return groomer["pictureUrl"]
 
 
 @app.post("/user/create", status_code=201, responses={400: {"model": output.Error}})
 async def create_user(user: input.CreateUser):
-    query = """
-    mutation {{
-        createUser(name: "{name}", contactNo: "{contact_no}", email: "{email}")
-    }}
-    """.format(name=user.name, contact_no=user.contactNo, email=user.email)
-    res = await graphql_client.query(query)
-    is_error = "errors" in res.json
+    res = await graphql_query(operations.CREATE_USER, {"name": user.name, "contactNo": user.contactNo,
+                                                       "email": user.email})
+    is_error = "errors" in res
     if is_error:
         return HTTPException(
-            status_code=400, detail=res.json["errors"][0]["message"])
+            status_code=400, detail=res["errors"][0]["message"])
     else:
-        channel.basic_publish(exchange=exchange_name, routing_key="sms.user",
-                              body=user.contactNo, properties=pika.BasicProperties(delivery_mode=2))
+        invalidate(users=(user.name,))
+        publisher.publish("sms.user", user.contactNo)
 
 
 @app.get("/user/read/{name}", status_code=200, response_model=output.ReadUser, responses={404: {"model": output.Error}})
 async def get_user(name: str):
-    query = """
-    query {{
-        getUser(name: "{name}") {{
-            name,
-            contactNo,
-            email
-        }}
-    }}
-    """.format(name=name)
-    res = await graphql_client.query(query)
-    res = res.json["data"]["getUser"]
+    with tracing.span("user", f"getUser {name}"):
+        res = await user_loader.load(name)
     if res == None:
         raise HTTPException(
             status_code=404, detail="user not found")
@@ -153,34 +313,48 @@ async def get_user(name: str):
         return res
 
 
+@app.post("/user/batch", status_code=200, response_model=dict[str, Optional[output.ReadUser]], responses={502: {"model": output.Error}}, description="Look up to 100 users by name at once. Names of users that do not exist map to `null`.")
+async def get_users(batch: input.Names):
+    names = list(dict.fromkeys(batch.names))
+    try:
+        users = await gather(*[get_user_info(name) for name in names])
+    except UtilError:
+        raise HTTPException(status_code=502, detail="unable to fetch users")
+    return dict(zip(names, users))
+
+
 @app.post("/user/update/{name}", status_code=200, responses={404: {"model": output.Error}}, description="None of the JSON fields are optional, you must send all the information together with the updated field to update an entry.")
 async def update_user(name: str, info: input.UpdateUser):
-    if info.contactNo != None:
-        info.contactNo = f"\"{info.contactNo}\""
-    else:
-        info.contactNo = "null"
-    if info.email != None:
-        info.email = f"\"{info.email}\""
-    else:
-        info.email = "null"
-    query = """
-    mutation {{
-        updateUser(name: "{name}", contactNo: {contact_no}, email: {email})
-    }}
-    """.format(name=name, contact_no=info.contactNo, email=info.email)
-    res = await graphql_client.query(query)
-    res = res.json
+    res = await graphql_query(operations.UPDATE_USER, {"name": name, "contactNo": info.contactNo,
+                                                       "email": info.email})
+    invalidate(users=(name,), tags=(f"user:{name}",))
     if res["data"] == None:
         raise HTTPException(
             status_code=404, detail=res["errors"][0]["message"])
 
 
+async def warm_prices(amounts: list[Optional[int]]):
+    # creates the Stripe Prices for a groomer's tiers ahead of their first checkout, checkout still works without it
+    amounts = [amount for amount in amounts if amount is not None]
+    if not amounts:
+        return
+    try:
+        # runs after the response went out, the request's deadline no longer applies
+        with deadline.within(None):
+            async with HttpClient.get_client("stripe").post("/prices", json={"amounts": amounts}):
+                pass
+    except (ClientError, asyncio.TimeoutError, CircuitOpenError):
+        pass
+
+
 @app.post("/groomer/create", status_code=201, responses={400: {"model": output.Error}})
-async def create_groomer(groomer: input.CreateGroomer):
-    async with HttpClient.get_client().post("http://groomer:5000/create", json=vars(groomer)) as resp:
+async def create_groomer(groomer: input.CreateGroomer, background_tasks: BackgroundTasks):
+    async with HttpClient.get_client("groomer").post("/create", json=vars(groomer)) as resp:
         if resp.ok:
-            channel.basic_publish(exchange=exchange_name, routing_key="sms.groomer",
-                                  body=groomer.contactNo, properties=pika.BasicProperties(delivery_mode=2))
+            invalidate(groomers=(groomer.name,), tags=("groomers",))
+            publisher.publish("sms.groomer", groomer.contactNo)
+            background_tasks.add_task(
+                warm_prices, [groomer.basic, groomer.premium, groomer.luxury])
         else:
             json = await resp.json()
             raise HTTPException(status_code=resp.status,
@@ -189,29 +363,28 @@ async def create_groomer(groomer: input.CreateGroomer):
 
 @app.get("/groomer/search/keyword/{keyword}", status_code=200, response_model=list[output.Groomer], responses={404: {"model": output.Error}, 400: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def search_groomer_by_keyword(keyword: str):
-    async with HttpClient.get_client().get(f"http://groomer:5000/search/keyword/{keyword}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+    return await passthrough(HttpClient.get_client("groomer"), "GET", f"/search/keyword/{keyword}", list[output.Groomer])
 
 
 @app.get("/groomer/search/name/{name}", status_code=200, response_model=output.Groomer, responses={404: {"model": output.Error}, 400: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def get_groomer_by_name(name: str):
-    async with HttpClient.get_client().get(f"http://groomer:5000/search/name/{name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+    return await passthrough(HttpClient.get_client("groomer"), "GET", f"/search/name/{name}", output.Groomer, hedge=True)
+
+
+@app.post("/groomer/batch", status_code=200, response_model=dict[str, Optional[output.Groomer]], responses={502: {"model": output.Error}}, description="Look up to 100 groomers by name at once. Names of groomers that do not exist map to `null`.")
+async def get_groomers(batch: input.Names):
+    names = list(dict.fromkeys(batch.names))
+    try:
+        groomers = await gather(*[get_groomer(name) for name in names])
+    except UtilError:
+        raise HTTPException(status_code=502, detail="unable to fetch groomers")
+    return dict(zip(names, groomers))
 
 
 @app.get("/groomer/delete/{name}", status_code=200, responses={400: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def delete_groomer(name: str):
-    async with HttpClient.get_client().get(f"http://groomer:5000/delete/{name}") as resp:
+    async with HttpClient.get_client("groomer").get(f"/delete/{name}") as resp:
+        invalidate(groomers=(name,), tags=(f"groomer:{name}", "groomers"))
         if not resp.ok:
             json = await resp.json()
             raise HTTPException(status_code=resp.status,
@@ -219,9 +392,12 @@ async def delete_groomer(name: str):
 
 
 @app.post("/groomer/update/{name}", status_code=200, responses={400: {"model": output.Error}}, description="All of the input fields are optional. If you want to search a keyword or name with a space, replace the space with %20")
-async def update_groomer(name: str, updated: input.UpdateGroomer):
-    async with HttpClient.get_client().post(f"http://groomer:5000/update/{name}", json=vars(updated)) as resp:
+async def update_groomer(name: str, updated: input.UpdateGroomer, background_tasks: BackgroundTasks):
+    async with HttpClient.get_client("groomer").post(f"/update/{name}", json=vars(updated)) as resp:
+        invalidate(groomers=(name,), tags=(f"groomer:{name}", "groomers"))
         if resp.ok:
+            background_tasks.add_task(
+                warm_prices, [updated.basic, updated.premium, updated.luxury])
             return
         else:
             json = await resp.json()
@@ -229,36 +405,30 @@ async def update_groomer(name: str, updated: input.UpdateGroomer):
                                 detail=json["message"])
 
 
-@app.post("/groomer/read", status_code=200, response_model=output.GroomerRead, responses={400: {"model": output.Error}}, summary="Filter groomers by accepted pet type or get every single groomer", description="All of the input fields are optional. Send an empty JSON: `{}`, to get every single groomer.")
-async def read_groomer(filters: input.ReadGroomer):
-    async with HttpClient.get_client().post("http://groomer:5000/read", json=vars(filters)) as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+@app.post("/groomer/read", status_code=200, response_model=output.GroomerRead, responses={400: {"model": output.Error}}, summary="Filter groomers by accepted pet type or get every single groomer", description="All of the input fields are optional. Send an empty JSON: `{}`, to get every single groomer. Pass `limit` to get a page of the results, the `X-Next-Cursor` response header holds the `cursor` for the next page. Send `Accept: application/x-ndjson` to get one item per line, streamed as it arrives.")
+async def read_groomer(filters: input.ReadGroomer, request: Request, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    if limit is None and cursor is None and not wants_ndjson(request):
+        return await passthrough(HttpClient.get_client("groomer"), "POST", "/read", output.GroomerRead, json=vars(filters))
+    return await listing(HttpClient.get_client("groomer"), "POST", "/read", request, limit, cursor, "name", key="result", json=vars(filters))
 
 
-@app.get("/comments/read/{groomer_name}", status_code=200, response_model=list[output.Comment], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
-async def get_comments(groomer_name: str):
-    async with HttpClient.get_client().get(f"http://comments:5000/{groomer_name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+@app.get("/comments/read/{groomer_name}", status_code=200, response_model=list[output.Comment], responses={400: {"model": output.Error}, 500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20. Pass `limit` to get a page of the results, the `X-Next-Cursor` response header holds the `cursor` for the next page. Send `Accept: application/x-ndjson` to get one item per line, streamed as it arrives.")
+async def get_comments(groomer_name: str, request: Request, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    if limit is None and cursor is None and not wants_ndjson(request):
+        return await passthrough(HttpClient.get_client("comments"), "GET", f"/{groomer_name}", list[output.Comment])
+    return await listing(HttpClient.get_client("comments"), "GET", f"/{groomer_name}", request, limit, cursor, "id")
 
 
 @app.get("/appointments/user/{user_name}", status_code=200, response_model=list[output.Appointment], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def get_appointments_of_user(user_name: str):
-    async with HttpClient.get_client().get(f"http://appointments:5000/user/{user_name}") as resp:
+    async with HttpClient.get_client("appointments").get(f"/user/{user_name}") as resp:
         json = await resp.json()
         if resp.ok:
-            urls = await asyncio.gather(*[get_groomer_picture_url(app["groomerName"]) for app in json])
+            # a user usually books the same few groomers, each is looked up once
+            names = list(dict.fromkeys(app["groomerName"] for app in json))
+            urls = dict(zip(names, await gather(*[get_groomer_picture_url(name) for name in names])))
             res = [{"id": app["id"], "groomerName": app["groomerName"], "startDate": app["startDate"], "endDate": app["endDate"],
-                    "groomerPictureUrl": urls[idx], "petNames": app["petNames"]} for idx, app in enumerate(json)]
+                    "groomerPictureUrl": urls[app["groomerName"]], "petNames": app["petNames"]} for app in json]
             return res
         else:
             raise HTTPException(status_code=resp.status,
@@ -267,40 +437,32 @@ async def get_appointments_of_user(user_name: str):
 
 @app.get("/appointments/signin/{groomer_name}", status_code=200, response_model=list[output.CustomerAppointments], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def get_arriving_customers(groomer_name: str):
-    async with HttpClient.get_client().get(f"http://appointments:5000/signin/{groomer_name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+    return await passthrough(HttpClient.get_client("appointments"), "GET", f"/signin/{groomer_name}", list[output.CustomerAppointments])
 
 
 @app.get("/appointments/staying/{groomer_name}", status_code=200, response_model=list[output.CustomerAppointments], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def get_staying_customers(groomer_name: str):
-    async with HttpClient.get_client().get(f"http://appointments:5000/staying/{groomer_name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+    return await passthrough(HttpClient.get_client("appointments"), "GET", f"/staying/{groomer_name}", list[output.CustomerAppointments])
 
 
-@app.get("/appointments/groomer/{groomer_name}", status_code=200, response_model=list[output.CustomerAppointments], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
-async def get_all_groomer_appointments(groomer_name: str):
-    async with HttpClient.get_client().get(f"http://appointments:5000/groomer/{groomer_name}") as resp:
-        json = await resp.json()
-        if resp.ok:
-            return json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+@app.get("/appointments/groomer/{groomer_name}", status_code=200, response_model=list[output.CustomerAppointments], responses={400: {"model": output.Error}, 500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20. Pass `limit` to get a page of the results, the `X-Next-Cursor` response header holds the `cursor` for the next page. Send `Accept: application/x-ndjson` to get one item per line, streamed as it arrives.")
+async def get_all_groomer_appointments(groomer_name: str, request: Request, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    if limit is None and cursor is None and not wants_ndjson(request):
+        return await passthrough(HttpClient.get_client("appointments"), "GET", f"/groomer/{groomer_name}", list[output.CustomerAppointments])
+    return await listing(HttpClient.get_client("appointments"), "GET", f"/groomer/{groomer_name}", request, limit, cursor, "id")
 
 
 @app.post("/appointments/get/{groomer_name}", status_code=200, response_model=list[output.CustomerAppointments], responses={500: {"model": output.Error}, 404: {"model": output.Error}}, description="If you want to search a keyword or name with a space, replace the space with %20")
 async def get_appointments_by_month(groomer_name: str, time: input.MonthYear):
-    async with HttpClient.get_client().post(f"http://appointments:5000/get/{groomer_name}", json=vars(time)) as resp:
+    return await passthrough(HttpClient.get_client("appointments"), "POST", f"/get/{groomer_name}", list[output.CustomerAppointments], json=vars(time))
+
+
+DASHBOARD_DEADLINE = float(os.getenv("DASHBOARD_DEADLINE", "3"))
+DASHBOARD_SECTIONS = ["profile", "arriving", "staying", "month", "comments"]
+
+
+async def fetch_json(upstream: str, method: str, path: str, **kwargs):
+    async with HttpClient.get_client(upstream).request(method, path, **kwargs) as resp:
         json = await resp.json()
         if resp.ok:
             return json
@@ -309,13 +471,81 @@ async def get_appointments_by_month(groomer_name: str, time: input.MonthYear):
                                 detail=json["message"])
 
 
+@app.get("/groomer/dashboard/{groomer_name}", status_code=200, response_model=output.GroomerDashboard, response_model_exclude_unset=True, responses={400: {"model": output.Error}, 404: {"model": output.Error}}, description="Everything a groomer's dashboard shows in one request. `fields` is a comma separated subset of profile, arriving, staying, month and comments, all of them by default. `month` and `year` pick the month view, the current month by default. Sections that fail or take too long are `null` and explained in `errors`.")
+async def get_groomer_dashboard(groomer_name: str, fields: Optional[str] = None, month: Optional[int] = Query(default=None, ge=1, le=12), year: Optional[int] = None):
+    selected = list(dict.fromkeys(fields.split(","))) if fields else DASHBOARD_SECTIONS
+    unknown = [field for field in selected if field not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail=f"unknown fields: {', '.join(unknown)}")
+    now = datetime.now(timezone.utc)
+    sections = {
+        "profile": lambda: get_groomer(groomer_name),
+        "arriving": lambda: fetch_json("appointments", "GET", f"/signin/{groomer_name}"),
+        "staying": lambda: fetch_json("appointments", "GET", f"/staying/{groomer_name}"),
+        "month": lambda: fetch_json("appointments", "POST", f"/get/{groomer_name}", json={"month": month or now.month, "year": year or now.year}),
+        "comments": lambda: fetch_json("comments", "GET", f"/{groomer_name}"),
+    }
+    # every section shares one deadline, a slow one is dropped instead of holding up the rest
+    timeout = deadline.timeout(DASHBOARD_DEADLINE)
+    tasks = {field: asyncio.ensure_future(sections[field]()) for field in selected}
+    await asyncio.wait(tasks.values(), timeout=timeout)
+    res = {}
+    errors = {}
+    for field, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            errors[field] = "timed out"
+        elif task.exception() is not None:
+            error = task.exception()
+            if isinstance(error, HTTPException):
+                errors[field] = error.detail
+            elif isinstance(error, asyncio.TimeoutError):
+                errors[field] = "timed out"
+            else:
+                errors[field] = "unavailable"
+        res[field] = task.result() if field not in errors else None
+    if "profile" in res and res["profile"] is None and "profile" not in errors:
+        raise HTTPException(status_code=404, detail="groomer not found")
+    if errors:
+        res["errors"] = errors
+    return res
+
+
+@app.get("/appointments/events/{groomer_name}", status_code=200, responses={200: {"content": {"text/event-stream": {}}}}, description="Server-Sent Events for the groomer's appointments as they are `created`, change `status` or are `refunded`. Reconnecting with the `Last-Event-ID` header replays the recent events that were missed.")
+async def get_appointment_events(groomer_name: str, request: Request):
+    last_event_id = request.headers.get("last-event-id")
+
+    async def stream():
+        queue = appointment_events.subscribe(groomer_name)
+        try:
+            for event in appointment_events.missed(groomer_name, last_event_id):
+                yield sse.format_event(event["type"], events.encode(event), id=event["id"])
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), sse.KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield sse.KEEPALIVE
+                    continue
+                # the subscriber fell too far behind, the client reconnects and catches up from Last-Event-ID
+                if event is None:
+                    return
+                yield sse.format_event(event["type"], events.encode(event), id=event["id"])
+        finally:
+            appointment_events.unsubscribe(groomer_name, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=sse.HEADERS)
+
+
 @app.post("/appointments/status/{appointment_id}", status_code=200, responses={400: {"model": output.Error}, 500: {"model": output.Error}, 404: {"model": output.Error}})
 async def change_appointment_status(appointment_id: str, status: input.Status):
-    async with HttpClient.get_client().post(f"http://appointments:5000/status/{appointment_id}", json=vars(status)) as resp:
+    async with HttpClient.get_client("appointments").post(f"/status/{appointment_id}", json=vars(status)) as resp:
+        json = await resp.json()
         if resp.ok:
+            publish_appointment_event("status", appointment_id, json["groomerName"], json["userName"],
+                                      status=json["status"])
             return
         else:
-            json = await resp.json()
             raise HTTPException(status_code=resp.status,
                                 detail=json["message"])
 
@@ -323,27 +553,28 @@ async def change_appointment_status(appointment_id: str, status: input.Status):
 @app.post("/comments/create", status_code=201, response_model=output.CensoredComment, responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}})
 async def create_comment(comment: input.CreateComment):
     # check if groomer or user is valid
-    res = await asyncio.gather(does_groomer_exist(comment.groomerName),
-                               does_user_exist(comment.userName))
+    res = await gather(does_groomer_exist(comment.groomerName),
+                       does_user_exist(comment.userName))
     if False in res:
         raise HTTPException(status_code=404,
                             detail="groomer or user does not exist")
     # check if customer has stayed (only customers that stayed are allowed to comment)
-    async with HttpClient.get_client().post("http://appointments:5000/stayed", json={"groomerName": comment.groomerName, "userName": comment.userName}) as resp:
+    async with HttpClient.get_client("appointments").post("/stayed", json={"groomerName": comment.groomerName, "userName": comment.userName}) as resp:
         if not resp.ok:
             json = await resp.json()
             raise HTTPException(status_code=resp.status,
                                 detail=json["message"])
     # censor the comment
     try:
-        message, title = await asyncio.gather(censor(comment.message), censor(comment.title))
+        message, title = await gather(censor(comment.message), censor(comment.title))
     except UtilError:
         raise HTTPException(status_code=400,
                             detail="unable to censor message")
     # post the comment
-    async with HttpClient.get_client().post("http://comments:5000/", json={"userName": comment.userName, "groomerName": comment.groomerName, "title": title, "message": message, "rating": comment.rating}) as resp:
+    async with HttpClient.get_client("comments").post("/", json={"userName": comment.userName, "groomerName": comment.groomerName, "title": title, "message": message, "rating": comment.rating}) as resp:
         json = await resp.json()
         if resp.ok:
+            invalidate(tags=(f"comments:{comment.groomerName}",))
             return json
         else:
             raise HTTPException(status_code=resp.status,
@@ -352,8 +583,9 @@ async def create_comment(comment: input.CreateComment):
 
 @app.post("/appointments/update/{groomer_name}", status_code=200, responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}}, description="To send the time in Javascript, call `date.toISOString()` on a `Date` object. If you want to search a keyword or name with a space, replace the space with %20")
 async def update_appointment_date(groomer_name: str, dates: input.AppointmentUpdate):
-    async with HttpClient.get_client().post(f"http://appointments:5000/update/{groomer_name}", json=vars(dates)) as resp:
+    async with HttpClient.get_client("appointments").post(f"/update/{groomer_name}", json=vars(dates)) as resp:
         if resp.ok:
+            invalidate(tags=("appointments",))
             return
         else:
             json = await resp.json()
@@ -361,66 +593,154 @@ async def update_appointment_date(groomer_name: str, dates: input.AppointmentUpd
                                 detail=json["message"])
 
 
-@app.post("/checkout", response_model=output.Checkout, responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}}, description="To send the time in Javascript, call `date.toISOString()` on a `Date` object.")
-async def checkout(checkout: input.Checkout):
+async def run_checkout(checkout: input.Checkout) -> dict:
     # check if groomer accepts the pets specified by the customer and return pricing info of the groomer
-    async with HttpClient.get_client().post(f"http://groomer:5000/accepts/{checkout.groomerName}", json={"petTypes": list(map(lambda x: x.petType, checkout.pets))}) as resp:
-        json = await resp.json()
-        if resp.ok:
-            price_tiers = json
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+    async def accepts(_):
+        async with HttpClient.get_client("groomer").post(f"/accepts/{checkout.groomerName}", json={"petTypes": list(map(lambda x: x.petType, checkout.pets))}) as resp:
+            json = await resp.json()
+            if resp.ok:
+                return json
+            else:
+                raise HTTPException(status_code=resp.status,
+                                    detail=json["message"])
+
     # get number of days
-    async with HttpClient.get_client().post("http://appointments:5000/quantity", json={"startTime": checkout.startTime, "endTime": checkout.endTime}) as resp:
-        json = await resp.json()
-        if resp.ok:
-            number_of_days = json["dayLength"]
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
-    pricing = price_tiers[checkout.priceTier]
-    # get stripe payment URL (you may realise that we did not check whether the user has paid for the service, this is a limitation of our microservices being locally hosted, resulting in the Stripe servers not being able to contact this microservice)
-    async with HttpClient.get_client().post("http://stripe:5000/create-checkout-session", json={"cust_checkout": [{"price_id": pricing, "quantity": number_of_days}]}) as resp:
-        if resp.ok:
+    async def quantity(_):
+        async with HttpClient.get_client("appointments").post("/quantity", json={"startTime": checkout.startTime, "endTime": checkout.endTime}) as resp:
             json = await resp.json()
-            checkout_url = json["checkout_url"]
-            transaction_id = json["id"]
-        else:
-            raise HTTPException(status_code=resp.status,
-                                detail="internal server error")
+            if resp.ok:
+                return json["dayLength"]
+            else:
+                raise HTTPException(status_code=resp.status,
+                                    detail=json["message"])
+
     # check if groomer and user exists
-    res = await asyncio.gather(does_groomer_exist(checkout.groomerName),
-                               does_user_exist(checkout.userName))
-    if False in res:
-        raise HTTPException(status_code=404,
-                            detail="groomer or user does not exist")
+    async def groomer_exists(_):
+        if not await does_groomer_exist(checkout.groomerName):
+            raise HTTPException(status_code=404,
+                                detail="groomer or user does not exist")
+
+    async def user_exists(_):
+        if not await does_user_exist(checkout.userName):
+            raise HTTPException(status_code=404,
+                                detail="groomer or user does not exist")
+
+    # get stripe payment URL (you may realise that we did not check whether the user has paid for the service, this is a limitation of our microservices being locally hosted, resulting in the Stripe servers not being able to contact this microservice)
+    async def payment(results):
+        pricing = results["accepts"][checkout.priceTier]
+        # the appointment lets the Stripe service hand a retried checkout the session it already created
+        appointment = {"groomerName": checkout.groomerName, "userName": checkout.userName,
+                       "startTime": checkout.startTime, "endTime": checkout.endTime}
+        async with HttpClient.get_client("stripe").post("/create-checkout-session", json={"cust_checkout": [{"price_id": pricing, "quantity": results["quantity"]}], "appointment": appointment}) as resp:
+            if resp.ok:
+                json = await resp.json()
+                return json["checkout_url"], json["id"]
+            else:
+                raise HTTPException(status_code=resp.status,
+                                    detail="internal server error")
+
     # create appointment entry
-    async with HttpClient.get_client().post("http://appointments:5000/create", json={"groomerName": checkout.groomerName, "userName": checkout.userName, "petInfo": [vars(pet) for pet in checkout.pets], "priceTier": checkout.priceTier, "totalPrice": pricing * number_of_days, "startTime": checkout.startTime, "endTime": checkout.endTime, "transactionId": transaction_id}) as resp:
-        if not resp.ok:
+    async def appointment(results):
+        pricing = results["accepts"][checkout.priceTier]
+        _, transaction_id = results["payment"]
+        async with HttpClient.get_client("appointments").post("/create", json={"groomerName": checkout.groomerName, "userName": checkout.userName, "petInfo": [vars(pet) for pet in checkout.pets], "priceTier": checkout.priceTier, "totalPrice": pricing * results["quantity"], "startTime": checkout.startTime, "endTime": checkout.endTime, "transactionId": transaction_id}) as resp:
             json = await resp.json()
-            raise HTTPException(status_code=resp.status,
-                                detail=json["message"])
+            if resp.ok:
+                return json["id"]
+            else:
+                raise HTTPException(status_code=resp.status,
+                                    detail=json["message"])
+
+    # validation steps are independent of each other, Stripe is only contacted once all of them pass
+    results = await run_dag([
+        Step("accepts", accepts),
+        Step("quantity", quantity),
+        Step("groomer_exists", groomer_exists),
+        Step("user_exists", user_exists),
+        Step("payment", payment, after=[
+             "accepts", "quantity", "groomer_exists", "user_exists"]),
+        Step("appointment", appointment, after=["payment"]),
+    ])
+    checkout_url, _ = results["payment"]
+    publish_appointment_event("created", results["appointment"], checkout.groomerName, checkout.userName,
+                              status="awaiting", startDate=checkout.startTime, endDate=checkout.endTime)
     return {"redirectUrl": checkout_url}
 
 
-@app.get("/refund/{appointment_id}", status_code=200, responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}})
+# checkout and refund wait on Stripe, which is slower than the services of this app
+PAYMENT_BUDGET = float(os.getenv("PAYMENT_BUDGET", "20"))
+
+
+@app.post("/checkout", response_model=output.Checkout, dependencies=[Depends(deadline.budget(PAYMENT_BUDGET))], responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}, 504: {"model": output.Error}}, description="To send the time in Javascript, call `date.toISOString()` on a `Date` object.")
+async def checkout(checkout: input.Checkout):
+    return await run_checkout(checkout)
+
+
+async def run_checkout_job(checkout: input.Checkout) -> dict:
+    try:
+        with deadline.within(PAYMENT_BUDGET):
+            return await run_checkout(checkout)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/checkout/jobs", status_code=202, response_model=output.CheckoutJob, responses={503: {"model": output.Error}}, description="Same as `/checkout`, but returns as soon as the request is validated. Poll `/checkout/jobs/{job_id}` or listen to `/checkout/jobs/{job_id}/events` for the `redirectUrl`.")
+async def submit_checkout(checkout: input.Checkout, request: Request, response: Response):
+    try:
+        job = await checkout_jobs.submit(lambda: run_checkout_job(checkout))
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="too many checkouts in progress, try again later",
+                            headers={"Retry-After": "5"})
+    response.headers["Location"] = f"{request.scope.get('root_path', '')}/checkout/jobs/{job.id}"
+    return job.view()
+
+
+@app.get("/checkout/jobs/{job_id}", status_code=200, response_model=output.CheckoutJob, responses={404: {"model": output.Error}}, description="A job that is still pending or running comes with a `Retry-After` header.")
+async def get_checkout_job(job_id: str, response: Response):
+    job = await checkout_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not job.done:
+        response.headers["Retry-After"] = "1"
+    return job.view()
+
+
+@app.get("/checkout/jobs/{job_id}/events", status_code=200, responses={200: {"content": {"text/event-stream": {}}}, 404: {"model": output.Error}}, description="Server-Sent Events with the job, named after its status, sent on every change. The stream ends once the job has succeeded or failed.")
+async def get_checkout_job_events(job_id: str):
+    job = await checkout_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    async def events():
+        async for update in checkout_jobs.watch(job_id, sse.KEEPALIVE_INTERVAL):
+            if update is None:
+                yield sse.KEEPALIVE
+            else:
+                yield sse.format_event(update.status, output.CheckoutJob(**update.view()).json())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=sse.HEADERS)
+
+
+@app.get("/refund/{appointment_id}", status_code=200, dependencies=[Depends(deadline.budget(PAYMENT_BUDGET))], responses={404: {"model": output.Error}, 500: {"model": output.Error}, 400: {"model": output.Error}, 504: {"model": output.Error}})
 async def refund(appointment_id: str):
     # get the transaction id from the appointment id
-    async with HttpClient.get_client().get(f"http://appointments:5000/transaction/{appointment_id}") as resp:
+    async with HttpClient.get_client("appointments").get(f"/transaction/{appointment_id}") as resp:
         json = await resp.json()
         if resp.ok:
             transaction_id = json["transactionId"]
+            groomer_name, user_name = json["groomerName"], json["userName"]
         else:
             raise HTTPException(status_code=resp.status,
                                 detail=json["message"])
     # refund the customer
-    async with HttpClient.get_client().post("http://stripe:5000/make-refund", json={"id": transaction_id}) as resp:
+    async with HttpClient.get_client("stripe").post("/make-refund", json={"id": transaction_id}) as resp:
         if not resp.ok:
             raise HTTPException(status_code=resp.status,
                                 detail="internal server error")
     # delete the appointment
-    async with HttpClient.get_client().delete(f"http://appointments:5000/delete/{appointment_id}") as resp:
+    async with HttpClient.get_client("appointments").delete(f"/delete/{appointment_id}") as resp:
         if not resp.ok:
             raise HTTPException(status_code=resp.status,
                                 detail=json["message"])
+    publish_appointment_event(
+        "refunded", appointment_id, groomer_name, user_name)
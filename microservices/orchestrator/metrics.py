@@ -0,0 +1,172 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+# Prometheus text exposition without a client library, observations only touch a dict and a list
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name,
+             value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def set_total(self, total: float, *labelvalues: str):
+        """For totals that are already counted elsewhere and only copied in at scrape time."""
+        self._values[labelvalues] = total
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        for values, total in self._values.items():
+            lines.append(
+                f"{self.name}{_labels(self.labelnames, values)} {total}")
+        return lines
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                   0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._le = [f'le="{float(bound)!r}"' for bound in self.buckets] + ['le="+Inf"']
+        # label values -> [count per bucket (last one is +Inf), sum]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = [[0] * (len(self.buckets) + 1), 0.0]
+            self._series[labelvalues] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for le, count in zip(self._le, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # called before every scrape to copy values that are cheaper to read than to track
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "orchestrator_request_duration_seconds", "Time spent handling a request, until the response starts.", ["route", "method", "status"]))
+UPSTREAM_DURATION = registry.register(Histogram(
+    "orchestrator_upstream_request_duration_seconds", "Time until an upstream responded.", ["upstream", "method"]))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "orchestrator_upstream_errors_total", "Upstream calls that failed, by kind of failure (timeout, deadline, connection, 5xx or circuit_open).", ["upstream", "kind"]))
+CACHE_REQUESTS = registry.register(Counter(
+    "orchestrator_cache_requests_total", "Cache lookups by result (hit, miss or coalesced into an in-flight load).", ["cache", "result"]))
+LOOP_LAG = registry.register(Histogram(
+    "orchestrator_event_loop_lag_seconds", "How late the event loop ran a callback that was due.", buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)))
+
+
+def track_caches(caches: dict):
+    """Export the hit and miss counts the caches keep themselves."""
+    def collect():
+        for name, cache in caches.items():
+            for result, count in cache.stats().items():
+                CACHE_REQUESTS.set_total(count, name, result)
+    registry.add_collector(collect)
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+async def _status_of(request: Request, exc: Exception) -> int:
+    """The status code the app answers `exc` with, going by the exception handlers registered on it."""
+    if isinstance(exc, HTTPException):
+        return exc.status_code
+    for cls in type(exc).__mro__:
+        handler = request.app.exception_handlers.get(cls)
+        if handler is not None:
+            # the handlers only build a response, running one twice has no other effect
+            response = await handler(request, exc)
+            return response.status_code
+    return 500
+
+
+class InstrumentedRoute(APIRoute):
+    """Records the latency of every request under its route template, so `/user/read/{name}` is one series."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def instrumented(request: Request) -> Response:
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except Exception as e:
+                status = await _status_of(request, e)
+                raise
+            finally:
+                # streamed bodies are still being sent at this point, this is the time to the first byte
+                REQUEST_DURATION.observe(
+                    time.perf_counter() - start, route, request.method, str(status))
+
+        return instrumented
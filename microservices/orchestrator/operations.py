@@ -0,0 +1,57 @@
+import hashlib
+import os
+from functools import lru_cache
+from typing import Any
+import graphql
+
+# PERSISTED_QUERIES=off always sends the full document, for a user service without the extension
+PERSISTED_QUERIES = os.getenv("PERSISTED_QUERIES", "on") != "off"
+NOT_PERSISTED = ("PersistedQueryNotFound", "PersistedQueryNotSupported")
+
+
+class Operation:
+    """A GraphQL operation of the user service, parsed once and sent as an automatic persisted query.
+
+    Only the sha256 of the document goes out, the server answers PersistedQueryNotFound until it was sent the
+    full document once. The documents are fixed, every value is passed in variables.
+    """
+
+    def __init__(self, document: str):
+        ast = graphql.parse(document)
+        self.name = ast.definitions[0].name.value
+        self.document = graphql.print_ast(ast)
+        self.hash = hashlib.sha256(self.document.encode()).hexdigest()
+
+    def payload(self, variables: dict[str, Any], persisted: bool = PERSISTED_QUERIES) -> dict[str, Any]:
+        """The JSON body of a request, sent without `persisted` it carries the document for the server to store."""
+        payload = {"operationName": self.name, "variables": variables,
+                   "extensions": {"persistedQuery": {"version": 1, "sha256Hash": self.hash}}}
+        if not persisted:
+            payload["query"] = self.document
+        return payload
+
+
+def not_persisted(res: dict) -> bool:
+    return any(error.get("message") in NOT_PERSISTED for error in res.get("errors") or [])
+
+
+CREATE_USER = Operation("""
+mutation CreateUser($name: String!, $contactNo: String!, $email: String!) {
+    createUser(name: $name, contactNo: $contactNo, email: $email)
+}
+""")
+
+UPDATE_USER = Operation("""
+mutation UpdateUser($name: String!, $contactNo: String, $email: String) {
+    updateUser(name: $name, contactNo: $contactNo, email: $email)
+}
+""")
+
+
+@lru_cache(maxsize=128)
+def get_users(count: int) -> Operation:
+    """Looks up `count` users at once, their names are the variables n0 to n{count - 1}."""
+    params = ", ".join(f"$n{idx}: String!" for idx in range(count))
+    fields = "\n".join(
+        f"u{idx}: getUser(name: $n{idx}) {{ name, contactNo, email }}" for idx in range(count))
+    return Operation(f"query GetUsers({params}) {{\n{fields}\n}}")
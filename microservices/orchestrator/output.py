@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from enum import Enum
+from typing import Optional
 
 
 class PetType(str, Enum):
@@ -89,9 +90,38 @@ class CustomerAppointments(BaseModel):
         use_enum_values = True
 
 
+class GroomerDashboard(BaseModel):
+    profile: Optional[Groomer]
+    arriving: Optional[list[CustomerAppointments]]
+    staying: Optional[list[CustomerAppointments]]
+    month: Optional[list[CustomerAppointments]]
+    comments: Optional[list[Comment]]
+    # sections that failed or missed the deadline, with the reason
+    errors: dict[str, str] = {}
+
+
 class Error(BaseModel):
     detail: str
 
 
 class Checkout(BaseModel):
     redirectUrl: str
+
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class JobError(BaseModel):
+    status: int
+    detail: str
+
+
+class CheckoutJob(BaseModel):
+    jobId: str
+    status: JobStatus
+    result: Optional[Checkout]
+    error: Optional[JobError]
@@ -0,0 +1,116 @@
+import logging
+import os
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# JavaScript's \w, which is what the bad-words package uses to find word boundaries
+WORD_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+# only ASCII letters are folded, str.lower() can change the length of non-ASCII text
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+                            "abcdefghijklmnopqrstuvwxyz")
+
+
+class Automaton:
+    """Aho-Corasick automaton that finds every occurrence of a fixed set of words in one pass."""
+
+    def __init__(self, words: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # lengths of the words that end in each state, including those reachable through fail links
+        self._out: list[tuple[int, ...]] = [()]
+        for word in words:
+            self._add(word)
+        self._link()
+
+    def _add(self, word: str):
+        state = 0
+        for char in word:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if len(word) not in self._out[state]:
+            self._out[state] += (len(word),)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int]]:
+        """Yield the (start, end) span of every word occurrence in `text`."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in out[state]:
+                yield idx + 1 - length, idx + 1
+
+
+class ProfanityFilter:
+    """Masks listed words the same way the `censorer` service (bad-words 3.0.4) does.
+
+    Only whole words match, case-insensitively. A matched word keeps its length, minus any
+    underscores, and every character is replaced by the placeholder.
+    """
+
+    def __init__(self, words: Iterable[str], placeholder: str = "*"):
+        # a listed word with non-word characters can never be a whole word on its own
+        self.words = {word.translate(ASCII_LOWER) for word in words
+                      if word and all(char in WORD_CHARS for char in word)}
+        self.placeholder = placeholder
+        self._automaton = Automaton(self.words)
+
+    def clean(self, text: str) -> str:
+        folded = text.translate(ASCII_LOWER)
+        n = len(text)
+        pieces = []
+        last = 0
+        for start, end in self._automaton.finditer(folded):
+            if start < last:
+                continue
+            if start > 0 and text[start - 1] in WORD_CHARS:
+                continue
+            if end < n and text[end] in WORD_CHARS:
+                continue
+            pieces.append(text[last:start])
+            pieces.append(self.placeholder * sum(char !=
+                          "_" for char in text[start:end]))
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return "".join(pieces)
+
+
+def load_filter(path: str) -> Optional[ProfanityFilter]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            words = [line.strip() for line in f]
+    except OSError:
+        logger.warning(
+            "word list %s could not be read, falling back to the censorer service", path)
+        return None
+    return ProfanityFilter(words)
+
+
+def from_env() -> Optional[ProfanityFilter]:
+    if os.getenv("CENSOR_MODE", "local") == "remote":
+        return None
+    return load_filter(os.getenv("CENSOR_WORDLIST", os.path.join(os.path.dirname(__file__), "wordlist.txt")))
@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+import logging
+import os
+import random
+from typing import Any, AsyncIterator, Optional
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError, parse_raw_as
+from starlette.background import BackgroundTask
+from jsonstream import iter_array
+from upstreams import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+# fraction of passthrough responses that are still validated against the route's response model,
+# every response is validated when DEBUG is set
+VALIDATE_RATE = 1.0 if os.getenv("DEBUG") else float(
+    os.getenv("PASSTHROUGH_VALIDATE_RATE", "0"))
+
+
+async def passthrough(client: UpstreamClient, method: str, path: str, model: Any, hedge: bool = False, **kwargs) -> Response:
+    """Send a successful upstream JSON response to the client as is, without decoding it.
+
+    Error responses are turned into an HTTPException carrying the upstream's message, like every other route does.
+    """
+    ctx = client.request(method, path, hedge=hedge, **kwargs)
+    resp = await ctx.__aenter__()
+    streaming = False
+    try:
+        if not resp.ok:
+            error = await resp.json()
+            raise HTTPException(status_code=resp.status,
+                                detail=error["message"])
+        if VALIDATE_RATE and random.random() < VALIDATE_RATE:
+            body = await resp.read()
+            try:
+                parse_raw_as(model, body)
+            except ValidationError:
+                logger.exception(
+                    "%s %s returned a response that does not match its model", method, path)
+                raise HTTPException(status_code=502,
+                                    detail="invalid response from upstream")
+            return Response(content=body, media_type="application/json")
+        headers = {}
+        # aiohttp decompresses bodies, the upstream length only holds for uncompressed ones
+        if "Content-Length" in resp.headers and "Content-Encoding" not in resp.headers:
+            headers["Content-Length"] = resp.headers["Content-Length"]
+        streaming = True
+        return StreamingResponse(resp.content.iter_any(), media_type="application/json", headers=headers,
+                                 background=BackgroundTask(ctx.__aexit__, None, None, None))
+    finally:
+        if not streaming:
+            await ctx.__aexit__(None, None, None)
+
+
+NDJSON = "application/x-ndjson"
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def encode_cursor(after: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": after}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        after = json.loads(base64.urlsafe_b64decode(
+            cursor + "=" * (-len(cursor) % 4)))["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if not isinstance(after, str):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return after
+
+
+async def _ndjson_lines(items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    async for item in items:
+        yield json.dumps(item).encode() + b"\n"
+
+
+async def listing(client: UpstreamClient, method: str, path: str, request: Request, limit: Optional[int],
+                  cursor: Optional[str], order_by: str, key: Optional[str] = None, **kwargs) -> Response:
+    """Send one page of an upstream JSON array, decoding it as it arrives instead of reading it whole.
+
+    The array is the upstream body, or its `key` member. The upstream pages it itself: it is sent `limit` and
+    `after`, and answers with at most `limit` items ordered by `order_by`, all of them greater than `after`. A page
+    holds `limit` items after `cursor`, the cursor for the page after it is sent in the X-Next-Cursor header. Without
+    a limit every remaining item is streamed, which needs `Accept: application/x-ndjson`. NDJSON responses carry one
+    item per line, JSON responses keep the upstream's shape.
+    """
+    ndjson = wants_ndjson(request)
+    params = {"after": decode_cursor(cursor)} if cursor else {}
+    if limit is not None or not ndjson:
+        limit = limit or MAX_PAGE_SIZE
+        # one item more than the page tells whether there is a page after it
+        params["limit"] = limit + 1
+    ctx = client.request(method, path, params=params, **kwargs)
+    resp = await ctx.__aenter__()
+    streaming = False
+    try:
+        if not resp.ok:
+            error = await resp.json()
+            raise HTTPException(status_code=resp.status,
+                                detail=error["message"])
+        items = iter_array(resp.content, key)
+        if limit is None:
+            streaming = True
+            return StreamingResponse(_ndjson_lines(items), media_type=NDJSON,
+                                     background=BackgroundTask(ctx.__aexit__, None, None, None))
+        page = []
+        headers = {}
+        async for item in items:
+            if len(page) == limit:
+                headers["X-Next-Cursor"] = encode_cursor(page[-1][order_by])
+                break
+            page.append(item)
+        await items.aclose()
+        if ndjson:
+            return Response(content="".join(json.dumps(item) + "\n" for item in page), media_type=NDJSON,
+                            headers=headers)
+        return Response(content=json.dumps({key: page} if key else page), media_type="application/json",
+                        headers=headers)
+    except (ValueError, KeyError, TypeError):
+        logger.exception("%s %s returned an invalid JSON array", method, path)
+        raise HTTPException(status_code=502,
+                            detail="invalid response from upstream")
+    finally:
+        if not streaming:
+            await ctx.__aexit__(None, None, None)
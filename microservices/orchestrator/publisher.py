@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+import pika
+import tracing
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+logger = logging.getLogger(__name__)
+
+
+async def open_connection(parameters: pika.ConnectionParameters) -> AsyncioConnection:
+    loop = asyncio.get_running_loop()
+    opened = loop.create_future()
+
+    def on_open(connection):
+        if opened.cancelled():
+            # the caller stopped waiting, nobody else would ever close this connection
+            connection.close()
+        elif not opened.done():
+            opened.set_result(connection)
+
+    def on_open_error(_, exc):
+        if not opened.done():
+            opened.set_exception(exc if isinstance(
+                exc, BaseException) else ConnectionError(exc))
+
+    AsyncioConnection(parameters, on_open_callback=on_open,
+                      on_open_error_callback=on_open_error, custom_ioloop=loop)
+    return await opened
+
+
+def _resolve(future: asyncio.Future):
+    # pika may still report completion after the caller timed out and cancelled the future
+    def set_result(result):
+        if not future.done():
+            future.set_result(result)
+    return set_result
+
+
+async def open_channel(connection: AsyncioConnection):
+    opened = asyncio.get_running_loop().create_future()
+    connection.channel(on_open_callback=_resolve(opened))
+    return await opened
+
+
+async def call(method, *args, **kwargs):
+    # pika's asynchronous channel methods report completion through a callback
+    done = asyncio.get_running_loop().create_future()
+    method(*args, callback=_resolve(done), **kwargs)
+    return await done
+
+
+class Message:
+    __slots__ = ("routing_key", "body")
+
+    def __init__(self, routing_key: str, body: bytes):
+        self.routing_key = routing_key
+        self.body = body
+
+
+class Publisher:
+    """Buffers messages in memory and publishes them to a topic exchange in confirmed batches.
+
+    The connection is owned by a background task that reconnects with exponential backoff, so
+    `publish` never touches the network and is safe to call from request handlers.
+    """
+
+    def __init__(self, parameters: pika.ConnectionParameters, exchange_name: str, exchange_type: str,
+                 bindings: dict[str, str], batch_size: int = 100, max_buffered: int = 10000,
+                 confirm_timeout: float = 5, connect_timeout: float = 10, min_backoff: float = 0.5, max_backoff: float = 30):
+        self.parameters = parameters
+        self.exchange_name = exchange_name
+        self.exchange_type = exchange_type
+        # queue name -> routing key
+        self.bindings = bindings
+        self.batch_size = batch_size
+        self.confirm_timeout = confirm_timeout
+        self.connect_timeout = connect_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._queue: asyncio.Queue[Message] = asyncio.Queue(maxsize=max_buffered)
+        # messages that were sent but never confirmed are retried before anything new
+        self._retry: deque[Message] = deque()
+        self._connection: Optional[AsyncioConnection] = None
+        self._channel = None
+        self._unconfirmed: dict[int, Message] = {}
+        self._next_tag = 1
+        self._batch_confirmed: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def connected(self) -> bool:
+        return self._channel is not None and self._channel.is_open
+
+    def publish(self, routing_key: str, body: str | bytes):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # only buffers the message, the broker round trip happens in the background and is not part of the request
+        with tracing.span("rabbitmq", f"publish {routing_key}"):
+            try:
+                self._queue.put_nowait(Message(routing_key, body))
+            except asyncio.QueueFull:
+                logger.warning(
+                    "publish buffer is full, dropping message for %s", routing_key)
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, drain_timeout: float = 5):
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), drain_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        finally:
+            self._task = None
+            self._teardown()
+
+    async def _run(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                await asyncio.wait_for(self._connect(), self.connect_timeout)
+                backoff = self.min_backoff
+                await self._flush_forever()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("rabbitmq publisher disconnected: %r", exc)
+            self._teardown()
+            if self._closing:
+                return
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _connect(self):
+        self._connection = await open_connection(self.parameters)
+        self._connection.add_on_close_callback(self._on_connection_closed)
+        channel = await open_channel(self._connection)
+        await call(channel.exchange_declare, exchange=self.exchange_name,
+                   exchange_type=self.exchange_type, durable=True)
+        for queue, routing_key in self.bindings.items():
+            await call(channel.queue_declare, queue=queue, durable=True)
+            await call(channel.queue_bind, queue=queue,
+                       exchange=self.exchange_name, routing_key=routing_key)
+        await call(channel.confirm_delivery, self._on_confirm)
+        self._next_tag = 1
+        self._channel = channel
+
+    async def _flush_forever(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                return
+            if not self.connected:
+                # the connection went away while waiting for messages, they go out on the next one
+                self._retry.extendleft(reversed(batch))
+                raise ConnectionError("channel closed")
+            self._batch_confirmed = asyncio.get_running_loop().create_future()
+            for idx, message in enumerate(batch):
+                try:
+                    self._channel.basic_publish(exchange=self.exchange_name, routing_key=message.routing_key,
+                                                body=message.body, properties=pika.BasicProperties(delivery_mode=2))
+                except Exception:
+                    self._retry.extendleft(reversed(batch[idx:]))
+                    raise
+                self._unconfirmed[self._next_tag] = message
+                self._next_tag += 1
+            await asyncio.wait_for(self._batch_confirmed, self.confirm_timeout)
+
+    async def _next_batch(self) -> list[Message]:
+        batch = []
+        while self._retry and len(batch) < self.batch_size:
+            batch.append(self._retry.popleft())
+        while not batch and self._queue.empty():
+            if self._closing:
+                return batch
+            # wake up periodically so that close() can end an idle loop
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), 0.5))
+            except asyncio.TimeoutError:
+                pass
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        tag = method.delivery_tag
+        if method.multiple:
+            tags = [t for t in self._unconfirmed if t <= tag]
+        else:
+            tags = [tag] if tag in self._unconfirmed else []
+        nacked = isinstance(method, pika.spec.Basic.Nack)
+        for t in tags:
+            message = self._unconfirmed.pop(t)
+            if nacked:
+                self._retry.append(message)
+        if not self._unconfirmed and self._batch_confirmed is not None and not self._batch_confirmed.done():
+            self._batch_confirmed.set_result(None)
+
+    def _on_connection_closed(self, _, exc):
+        self._channel = None
+        if self._batch_confirmed is not None and not self._batch_confirmed.done():
+            self._batch_confirmed.set_exception(
+                ConnectionError(f"connection closed: {exc!r}"))
+
+    def _teardown(self):
+        # anything still awaiting a confirm is published again on the next connection
+        self._retry.extendleft(reversed(list(self._unconfirmed.values())))
+        self._unconfirmed.clear()
+        self._channel = None
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            self._connection.close()
+        self._connection = None
@@ -0,0 +1,86 @@
+"""Runs the orchestrator in one uvicorn worker process per available core.
+
+The socket is bound once here and shared by the workers, each builds its own clients and connections in the app's
+lifespan. Workers that exit are started again. WEB_CONCURRENCY overrides the worker count. In-process state like
+the response cache and /metrics is per worker.
+"""
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+import uvicorn
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5000"))
+
+# a spawned worker starts from a fresh interpreter, nothing from this process is inherited but the socket
+spawn = multiprocessing.get_context("spawn")
+multiprocessing.allow_connection_pickling()
+
+
+def cpu_limit() -> int:
+    """Cores this process may run on, taking the container's CPU quota into account."""
+    cores = len(os.sched_getaffinity(0)) if hasattr(
+        os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def worker_count() -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    return max(1, int(configured)) if configured else cpu_limit()
+
+
+def config() -> uvicorn.Config:
+    return uvicorn.Config("main:app", host=HOST, port=PORT, lifespan="on")
+
+
+def _worker(sock: socket.socket):
+    server = uvicorn.Server(config())
+    server.config.configure_logging()
+    server.run(sockets=[sock])
+
+
+def main():
+    workers = worker_count()
+    if workers == 1:
+        uvicorn.Server(config()).run()
+        return
+    # checkout jobs are polled through whichever worker gets the request
+    os.environ.setdefault("CHECKOUT_JOB_DB", os.path.join(
+        tempfile.gettempdir(), "orchestrator-jobs.db"))
+    sock = config().bind_socket()
+    children: list[multiprocessing.Process] = []
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        children = [child for child in children if child.is_alive()]
+        while len(children) < workers:
+            child = spawn.Process(target=_worker, args=(sock,))
+            child.start()
+            children.append(child)
+        time.sleep(1)
+    # uvicorn shuts a worker down gracefully on SIGTERM, finishing the requests in flight
+    for child in children:
+        child.terminate()
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+from typing import Optional
+
+# idle streams send a comment this often so proxies do not time them out
+KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+KEEPALIVE = ": keep-alive\n\n"
+# sent with every stream, the second header stops nginx based proxies from buffering it
+HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_event(event: str, data: str, id: Optional[str] = None) -> str:
+    lines = [f"id: {id}"] if id is not None else []
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,46 @@
+"""Outputs of bad-words 3.0.4, the censorer service's filter, that the in-process filter has to reproduce.
+
+The expectations are the examples from the bad-words README and what its `clean` does with words added through
+`addWords`: the text is split on word boundaries and every piece that is a listed word, ignoring case, has its
+characters other than letters, digits, `|`, `$` and `@` removed and the rest replaced by the placeholder.
+"""
+from profanity import ProfanityFilter
+
+
+def test_readme_examples():
+    assert ProfanityFilter(["ash0le"]).clean(
+        "Don't be an ash0le") == "Don't be an ******"
+    assert ProfanityFilter(["ash0le"], placeholder="x").clean(
+        "Don't be an ash0le") == "Don't be an xxxxxx"
+    assert ProfanityFilter(["some", "bad", "word"]).clean(
+        "some bad word!") == "**** *** ****!"
+    assert ProfanityFilter([]).clean(
+        "hell this wont clean anything") == "hell this wont clean anything"
+
+
+def test_whole_words_only():
+    words = ProfanityFilter(["bad"])
+    assert words.clean("badly bad_word abad") == "badly bad_word abad"
+    assert words.clean("bad,bad.bad") == "***,***.***"
+    assert words.clean("(bad)") == "(***)"
+
+
+def test_case_insensitive():
+    assert ProfanityFilter(["bad"]).clean("Bad BAD bAd") == "*** *** ***"
+    assert ProfanityFilter(["BAD"]).clean("bad") == "***"
+
+
+def test_non_ascii_is_a_word_boundary():
+    # JavaScript's \b only knows ASCII word characters
+    assert ProfanityFilter(["bad"]).clean("ébadé") == "é***é"
+    assert ProfanityFilter(["bad"]).clean("İbad") == "İ***"
+
+
+def test_words_with_non_word_characters_never_match():
+    # \b cannot sit inside "a-b", bad-words never finds it as a single piece
+    assert ProfanityFilter(["a-b"]).clean("a-b") == "a-b"
+
+
+def test_overlapping_words():
+    words = ProfanityFilter(["hell", "hells"])
+    assert words.clean("hells hell") == "***** ****"
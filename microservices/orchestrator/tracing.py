@@ -0,0 +1,104 @@
+import os
+import string
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from urllib.parse import quote
+from starlette.datastructures import Headers, MutableHeaders
+
+# requests slower than this are kept for /debug/slow-requests
+SLOW_REQUEST_MS = float(os.getenv("TRACE_SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_BUFFER = int(os.getenv("TRACE_SLOW_REQUEST_BUFFER", "100"))
+# descriptions carry path parameters sent by the client, anything else is percent-encoded before going into a header
+HEADER_SAFE = "".join(char for char in string.printable
+                      if char not in string.whitespace + '"\\%') + " "
+
+
+class Trace:
+    """Spans of one request, shared by every task the handler starts since they inherit its context."""
+
+    __slots__ = ("start", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (name, description, offset from the start of the request, duration), in seconds
+        self.spans: list[tuple[str, str, float, float]] = []
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def ordered(self) -> list[tuple[str, str, float, float]]:
+        return sorted(self.spans, key=lambda span: span[2])
+
+    def server_timing(self) -> str:
+        entries = [f'{name};desc="{quote(description, safe=HEADER_SAFE)} @{offset * 1000:.1f}ms"'
+                   f';dur={duration * 1000:.1f}' for name, description, offset, duration in self.ordered()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_BUFFER)
+
+
+@contextmanager
+def span(name: str, description: str = "") -> Iterator[None]:
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append(
+            (name, description.replace('"', "'"), start - trace.start, time.perf_counter() - start))
+
+
+class TracingMiddleware:
+    """Adds a Server-Timing header listing the spans recorded while handling a request.
+
+    Spans that finish after the response has started, like a streamed body, only show up in the slow request buffer.
+    Event streams stay open for as long as the client listens and are never kept there.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace()
+        token = _trace.set(trace)
+        status = 500
+        event_stream = False
+
+        async def send_with_timing(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                event_stream = Headers(raw=message["headers"]).get(
+                    "content-type", "").startswith("text/event-stream")
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _trace.reset(token)
+            total = trace.elapsed()
+            if total * 1000 >= SLOW_REQUEST_MS and not event_stream:
+                slow_requests.append({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "startedAt": time.time() - total,
+                    "totalMs": round(total * 1000, 1),
+                    "spans": [{"name": name, "description": description, "offsetMs": round(offset * 1000, 1),
+                               "durationMs": round(duration * 1000, 1)}
+                              for name, description, offset, duration in trace.ordered()],
+                })
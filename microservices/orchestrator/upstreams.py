@@ -0,0 +1,219 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from aiohttp import ClientError, ClientResponse, ClientSession, ClientTimeout, TCPConnector
+from metrics import UPSTREAM_DURATION, UPSTREAM_ERRORS
+import deadline
+import tracing
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, upstream: str):
+        super().__init__(f"{upstream} is unavailable")
+        self.upstream = upstream
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast until `reset_timeout` has passed.
+
+    Once the timeout has passed a single trial request is let through, its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self._trial_running = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_cancelled(self):
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class Upstream:
+    def __init__(self, name: str, base_url: str, limit: int = 100, keepalive_timeout: float = 30,
+                 ttl_dns_cache: int = 300, timeout: float = 9, hedge_after: Optional[float] = None,
+                 failure_threshold: int = 5, reset_timeout: float = 10):
+        env = name.upper()
+        self.name = name
+        self.base_url = os.getenv(f"{env}_URL", base_url)
+        self.limit = int(os.getenv(f"{env}_POOL_SIZE", limit))
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.timeout = float(os.getenv(f"{env}_TIMEOUT", timeout))
+        hedge_after = os.getenv(f"{env}_HEDGE_AFTER", hedge_after)
+        # hedging is opt-in, a second copy of a request is only sent when this is set
+        self.hedge_after = float(hedge_after) if hedge_after else None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+UPSTREAMS = {upstream.name: upstream for upstream in [
+    Upstream("user", "http://user:5000", limit=50, timeout=5),
+    Upstream("groomer", "http://groomer:5000", timeout=5),
+    Upstream("appointments", "http://appointments:5000", timeout=5),
+    Upstream("comments", "http://comments:5000", timeout=5),
+    # Stripe calls go out to the Stripe API, they are slower and should not hold many sockets
+    Upstream("stripe", "http://stripe:5000", limit=20, timeout=9),
+    Upstream("censorer", "http://censorer:5000", limit=20, timeout=3),
+]}
+
+
+class UpstreamClient:
+    """Connection pool, timeout budget and circuit breaker for one upstream service.
+
+    `request`, `get`, `post` and `delete` take a path relative to the upstream's base URL and are used like the
+    `aiohttp.ClientSession` methods of the same name.
+    """
+
+    def __init__(self, upstream: Upstream):
+        self.upstream = upstream
+        self.breaker = CircuitBreaker(
+            upstream.failure_threshold, upstream.reset_timeout)
+        self._session: Optional[ClientSession] = None
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None:
+            connector = TCPConnector(limit=self.upstream.limit, keepalive_timeout=self.upstream.keepalive_timeout,
+                                     ttl_dns_cache=self.upstream.ttl_dns_cache)
+            self._session = ClientSession(base_url=self.upstream.base_url, connector=connector,
+                                          timeout=ClientTimeout(total=self.upstream.timeout))
+        return self._session
+
+    def request(self, method: str, path: str, hedge: bool = False, **kwargs) -> "RequestContext":
+        """Only set `hedge` for idempotent requests, a slow request may be sent twice."""
+        return RequestContext(self, method, path, hedge, kwargs)
+
+    def get(self, path: str, hedge: bool = False, **kwargs) -> "RequestContext":
+        return self.request("GET", path, hedge, **kwargs)
+
+    def post(self, path: str, **kwargs) -> "RequestContext":
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> "RequestContext":
+        return self.request("DELETE", path, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def send(self, method: str, path: str, hedge: bool, kwargs: dict) -> ClientResponse:
+        name = self.upstream.name
+        # the call gets what is left of the request's deadline, and tells the upstream how much that is
+        try:
+            timeout = deadline.timeout(self.upstream.timeout)
+        except deadline.DeadlineExceeded:
+            UPSTREAM_ERRORS.inc(name, "deadline")
+            raise
+        kwargs = {**kwargs, "timeout": ClientTimeout(total=timeout),
+                  "headers": {**(kwargs.get("headers") or {}), **deadline.header(timeout)}}
+        if not self.breaker.allow():
+            UPSTREAM_ERRORS.inc(name, "circuit_open")
+            raise CircuitOpenError(name)
+        start = time.perf_counter()
+        try:
+            with tracing.span(name, f"{method} {path}"):
+                if hedge and self.upstream.hedge_after is not None:
+                    resp = await self._send_hedged(method, path, kwargs)
+                else:
+                    resp = await self.session.request(method, path, **kwargs)
+        except asyncio.TimeoutError as e:
+            if timeout < self.upstream.timeout:
+                # cut short by the request's deadline, the upstream may well have been in time on its own
+                self.breaker.record_cancelled()
+                UPSTREAM_ERRORS.inc(name, "deadline")
+                raise deadline.DeadlineExceeded from e
+            self.breaker.record_failure()
+            UPSTREAM_ERRORS.inc(name, "timeout")
+            raise
+        except ClientError:
+            self.breaker.record_failure()
+            UPSTREAM_ERRORS.inc(name, "connection")
+            raise
+        except asyncio.CancelledError:
+            # the caller gave up, this says nothing about the health of the upstream
+            self.breaker.record_cancelled()
+            raise
+        self.record(method, time.perf_counter() - start, resp.status)
+        if resp.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return resp
+
+    def record(self, method: str, duration: float, status: int):
+        """Export the latency of a finished call."""
+        UPSTREAM_DURATION.observe(duration, self.upstream.name, method)
+        if status >= 500:
+            UPSTREAM_ERRORS.inc(self.upstream.name, "5xx")
+
+    async def _send_hedged(self, method: str, path: str, kwargs: dict) -> ClientResponse:
+        tasks = [asyncio.create_task(
+            self.session.request(method, path, **kwargs))]
+        done, _ = await asyncio.wait(tasks, timeout=self.upstream.hedge_after)
+        if not done:
+            tasks.append(asyncio.create_task(
+                self.session.request(method, path, **kwargs)))
+        winner = None
+        error = None
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+            if winner is None:
+                raise error
+            return winner.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif task is not winner and not task.cancelled() and task.exception() is None:
+                    task.result().release()
+
+
+class RequestContext:
+    def __init__(self, client: UpstreamClient, method: str, path: str, hedge: bool, kwargs: dict):
+        self._client = client
+        self._method = method
+        self._path = path
+        self._hedge = hedge
+        self._kwargs = kwargs
+        self._resp: Optional[ClientResponse] = None
+
+    async def __aenter__(self) -> ClientResponse:
+        self._resp = await self._client.send(self._method, self._path, self._hedge, self._kwargs)
+        return self._resp
+
+    async def __aexit__(self, *_):
+        self._resp.release()
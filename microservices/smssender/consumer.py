@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+
+logger = logging.getLogger(__name__)
+
+
+class Consumer:
+    """Consumes a queue with manual acks and hands every message to a thread pool.
+
+    The connection's I/O loop only dispatches and settles messages, `handler(method, properties, body)` runs on a
+    worker thread. A message is acked once its handler returned and rejected back onto the queue if it raised, so
+    nothing is lost when the process dies mid-send. At most `prefetch` messages are unacked at a time, which also
+    bounds the work queued up for the pool.
+
+    With a `limiter`, messages are handed to the pool no faster than it admits, the delay is a timer on the
+    connection so receiving and acking carry on meanwhile. `on_failure(channel, method, properties, body, error)`
+    replaces requeueing failed messages, it runs on the connection's thread and has to ack or reject the message.
+    """
+
+    def __init__(self, connect: Callable[[], pika.BlockingConnection], setup: Callable[[BlockingChannel], None],
+                 queue: str, handler: Callable, prefetch: int = 20, workers: int = 8,
+                 limiter=None, on_failure: Optional[Callable] = None):
+        self.connect = connect
+        self.setup = setup
+        self.queue = queue
+        self.handler = handler
+        self.prefetch = prefetch
+        self.workers = workers
+        self.limiter = limiter
+        self.on_failure = on_failure
+
+    def run(self):
+        connection = self.connect()
+        channel = connection.channel()
+        self.setup(channel)
+        channel.basic_qos(prefetch_count=self.prefetch)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def on_message(channel, method, properties, body):
+            delay = self.limiter.reserve() if self.limiter is not None else 0
+            if delay > 0:
+                connection.call_later(delay, partial(
+                    submit, channel, method, properties, body))
+            else:
+                submit(channel, method, properties, body)
+
+        def submit(channel, method, properties, body):
+            if not channel.is_open:
+                return
+            future = executor.submit(self.handler, method, properties, body)
+            future.add_done_callback(
+                partial(on_done, channel, method, properties, body))
+
+        def on_done(channel, method, properties, body, future):
+            # pika is not thread safe, the ack has to be sent from the connection's own thread
+            if connection.is_open:
+                connection.add_callback_threadsafe(
+                    partial(self.settle, channel, method, properties, body, future))
+
+        channel.basic_consume(queue=self.queue, on_message_callback=on_message)
+        try:
+            channel.start_consuming()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if connection.is_open:
+                connection.close()
+
+    def settle(self, channel: BlockingChannel, method, properties, body: bytes, future: Future):
+        # unacked messages of a closed channel are redelivered by the broker anyway
+        if not channel.is_open:
+            return
+        if future.exception() is None:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        elif self.on_failure is not None:
+            self.on_failure(channel, method, properties,
+                            body, future.exception())
+        else:
+            logger.warning("handling %s failed (%r), requeueing",
+                           method.routing_key, future.exception())
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+
+def _child(target: Callable[[], None]):
+    # the parent's handlers only set its stop flag
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    target()
+
+
+def run_processes(target: Callable[[], None], processes: int):
+    """Run `target` in `processes` child processes, restarting any that exit, until SIGTERM or SIGINT."""
+    if processes <= 1:
+        target()
+        return
+    children: list[multiprocessing.Process] = []
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        for child in children:
+            if not child.is_alive():
+                logger.warning("consumer process %s exited with %s, restarting",
+                               child.pid, child.exitcode)
+        children = [child for child in children if child.is_alive()]
+        while len(children) < processes:
+            child = multiprocessing.Process(
+                target=_child, args=(target,), daemon=True)
+            child.start()
+            logger.info("started consumer process %s", child.pid)
+            children.append(child)
+        time.sleep(1)
+    for child in children:
+        child.terminate()
+    for child in children:
+        child.join()
@@ -0,0 +1,94 @@
+import logging
+import time
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+
+ATTEMPT_HEADER = "x-attempt"
+ROUTING_KEY_HEADER = "x-original-routing-key"
+ERROR_HEADER = "x-last-error"
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Admits `rate` events per second on average with bursts of up to `burst`.
+
+    `reserve` never waits, it takes a token, possibly going into debt, and returns how long the caller has to delay
+    the event for. Delays of successive reservations grow by 1/rate each, so a backlog drains at exactly `rate`.
+    Not thread safe, only the consumer's connection thread uses it.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RetryQueues:
+    """Delays failed messages in tiered queues and then puts them back onto the work queue.
+
+    Each tier is a queue with a message TTL whose expired messages are dead-lettered to the exchange with
+    `due_routing_key`, which the work queue is bound to. Every message in a tier waits equally long, so a message is
+    never stuck behind one with a longer delay. Messages that failed on every tier are parked for manual inspection.
+    """
+
+    def __init__(self, exchange: str, queue: str, delays: list[int], due_routing_key: str, parking_queue: str):
+        self.exchange = exchange
+        self.queue = queue
+        self.delays = delays
+        self.due_routing_key = due_routing_key
+        self.parking_queue = parking_queue
+
+    def declare(self, channel: BlockingChannel):
+        for delay in self.delays:
+            tier = f"{self.queue}-retry-{delay}s"
+            channel.queue_declare(queue=tier, durable=True, arguments={
+                "x-message-ttl": delay * 1000,
+                "x-dead-letter-exchange": self.exchange,
+                "x-dead-letter-routing-key": self.due_routing_key,
+            })
+            channel.queue_bind(exchange=self.exchange, queue=tier,
+                               routing_key=self.tier_routing_key(delay))
+        channel.queue_bind(exchange=self.exchange,
+                           queue=self.queue, routing_key=self.due_routing_key)
+        channel.queue_declare(queue=self.parking_queue, durable=True)
+        channel.queue_bind(exchange=self.exchange,
+                           queue=self.parking_queue, routing_key=self.parking_queue)
+
+    def tier_routing_key(self, delay: int) -> str:
+        return f"{self.queue}-retry.{delay}s"
+
+    def route(self, channel: BlockingChannel, method, properties: pika.BasicProperties, body: bytes, error: BaseException):
+        """Move a message whose handler failed to its next retry tier, or park it, and ack the original."""
+        headers = dict(properties.headers or {})
+        attempt = int(headers.get(ATTEMPT_HEADER, 0)) + 1
+        headers[ATTEMPT_HEADER] = attempt
+        headers.setdefault(ROUTING_KEY_HEADER, method.routing_key)
+        headers[ERROR_HEADER] = repr(error)[:500]
+        if attempt <= len(self.delays):
+            routing_key = self.tier_routing_key(self.delays[attempt - 1])
+            logger.warning("sending %s failed (%r) on attempt %s, retrying through %s",
+                           headers[ROUTING_KEY_HEADER], error, attempt, routing_key)
+        else:
+            routing_key = self.parking_queue
+            logger.error("sending %s failed (%r) on attempt %s, parking it in %s",
+                         headers[ROUTING_KEY_HEADER], error, attempt, routing_key)
+        channel.basic_publish(exchange=self.exchange, routing_key=routing_key, body=body,
+                              properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent, headers=headers))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def original_routing_key(method, properties: pika.BasicProperties) -> str:
+    """The routing key a message was first published with, retried messages come back under another one."""
+    headers = properties.headers or {}
+    routing_key = headers.get(ROUTING_KEY_HEADER, method.routing_key)
+    return routing_key.decode() if isinstance(routing_key, bytes) else routing_key
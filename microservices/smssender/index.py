@@ -1,18 +1,36 @@
+import logging
 import pika
 from twilio.rest import Client
 import os
 import time
-
-time.sleep(9)
+from consumer import Consumer, run_processes
+from dispatch import RetryQueues, TokenBucket, original_routing_key
 
 ACCOUNT_SID = os.getenv("ACCOUNT_SID")
 AUTH_TOKEN = os.getenv("AUTH_TOKEN")
 MESSAGING_SERVICE_SID = os.getenv("MESSAGING_SERVICE_SID")
 client = Client(ACCOUNT_SID, AUTH_TOKEN)
 
+# module level so that consumer processes started with spawn log the same way
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                    format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("smssender")
+
+# unacked messages per consumer, the most that can be in flight at once
+PREFETCH = int(os.getenv("SMS_PREFETCH", "20"))
+# concurrent Twilio calls per consumer process
+WORKERS = int(os.getenv("SMS_WORKERS", "8"))
+PROCESSES = int(os.getenv("SMS_PROCESSES", "1"))
+# messages per second the provider accepts from us, shared by all consumer processes
+RATE = float(os.getenv("SMS_RATE", "10"))
+BURST = float(os.getenv("SMS_BURST", RATE))
+# seconds a failed message waits before each retry, it is parked after the last one
+RETRY_DELAYS = [int(delay) for delay in os.getenv(
+    "SMS_RETRY_DELAYS", "5,20,80,320").split(",")]
 
-def callback(channel, method, properties, body):
-    recipient_type = method.routing_key.split('.')[1]
+
+def callback(method, properties, body):
+    recipient_type = original_routing_key(method, properties).split('.')[1]
     contact_no = body.decode("utf-8")
     if recipient_type == "user":
         message = "Dear user, thanks for signing up with our service!"
@@ -28,23 +46,53 @@ def callback(channel, method, properties, body):
 hostname = "esd-rabbit"
 port = 5672
 
-connection = pika.BlockingConnection(
-    pika.ConnectionParameters(host=hostname, port=port,
-                              heartbeat=3600, blocked_connection_timeout=3600)
-)
-
-channel = connection.channel()
-
 exchange_name = "main"
 exchange_type = "topic"
-channel.exchange_declare(exchange=exchange_name,
-                         exchange_type=exchange_type, durable=True)
-
 queue_name = "sms"
-channel.queue_declare(queue=queue_name, durable=True)
 
-channel.queue_bind(exchange=exchange_name,
-                   queue=queue_name, routing_key="sms.*")
+retry_queues = RetryQueues(exchange_name, queue_name, RETRY_DELAYS,
+                           due_routing_key="sms-retry.due", parking_queue="sms-parked")
+
+
+def connect(min_backoff=0.5, max_backoff=30):
+    # RabbitMQ may still be starting, retry with exponential backoff instead of sleeping a fixed time up front
+    backoff = min_backoff
+    while True:
+        try:
+            return pika.BlockingConnection(
+                pika.ConnectionParameters(host=hostname, port=port,
+                                          heartbeat=3600, blocked_connection_timeout=3600)
+            )
+        except pika.exceptions.AMQPConnectionError as e:
+            logger.warning("RabbitMQ is not reachable (%r), retrying in %ss", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+
+def setup(channel):
+    channel.exchange_declare(exchange=exchange_name,
+                             exchange_type=exchange_type, durable=True)
+
+    channel.queue_declare(queue=queue_name, durable=True)
+
+    channel.queue_bind(exchange=exchange_name,
+                       queue=queue_name, routing_key="sms.*")
+
+    retry_queues.declare(channel)
+    logger.info("SMS sender is consuming")
+
+
+def consume():
+    consumer = Consumer(connect, setup, queue_name, callback,
+                        prefetch=PREFETCH, workers=WORKERS,
+                        limiter=TokenBucket(RATE / PROCESSES, max(1, BURST / PROCESSES)),
+                        on_failure=retry_queues.route)
+    while True:
+        try:
+            consumer.run()
+        except pika.exceptions.AMQPConnectionError as e:
+            logger.warning("lost connection to RabbitMQ (%r), reconnecting", e)
+
 
-channel.basic_consume(queue="sms", on_message_callback=callback, auto_ack=True)
-channel.start_consuming()
+if __name__ == "__main__":
+    run_processes(consume, PROCESSES)
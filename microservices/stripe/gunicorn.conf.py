@@ -0,0 +1,12 @@
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# requests mostly wait on the Stripe API, threads overlap those waits without a process each
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Stripe calls can take several seconds
+timeout = 60
+keepalive = 5
+accesslog = "-"
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def idempotency_key(appointment, line_items):
+    """Same appointment request, same key, whatever order the JSON fields arrived in."""
+    payload = json.dumps({"appointment": appointment, "line_items": line_items},
+                         sort_keys=True, separators=(",", ":"))
+    return "checkout-" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Pending:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class IdempotencyStore:
+    """Bounded, thread safe store of results by idempotency key, each kept for `ttl` seconds.
+
+    Concurrent calls with the same key wait for the first one instead of repeating its work. Failures are not kept,
+    the next call with that key tries again.
+    """
+
+    def __init__(self, maxsize=10000, ttl=1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = {}
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    return value
+                del self._entries[key]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = _Pending()
+                self._pending[key] = pending
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value = create()
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if pending.error is None:
+                    self._entries[key] = (
+                        time.monotonic() + self.ttl, pending.value)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+            pending.done.set()
+        return pending.value
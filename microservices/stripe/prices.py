@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+import stripe
+
+
+class PriceResolver:
+    """Maps a whole-unit amount and currency to a Stripe Price ID, creating the Price the first time it is needed.
+
+    Mappings are kept in memory and in SQLite, so a restarted or newly forked worker does not ask Stripe again. A
+    Price created by another worker or an earlier deployment is found through its lookup key before creating one.
+    """
+
+    def __init__(self, db_path, currency="sgd", product_name="Grooming"):
+        self.db_path = db_path
+        self.currency = currency
+        self.product_name = product_name
+        self._prices = {}
+        # guards _prices and _key_locks only, it is never held while talking to Stripe
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._product_lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS prices (amount INTEGER NOT NULL, currency TEXT NOT NULL, "
+                       "price_id TEXT NOT NULL, PRIMARY KEY (amount, currency))")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        # a connection per use, sqlite3 connections cannot be shared between gunicorn's threads
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def seed(self, prices, currency=None):
+        """Record Prices that already exist in Stripe, without overwriting stored ones."""
+        currency = currency or self.currency
+        with self._connect() as db:
+            db.executemany("INSERT OR IGNORE INTO prices VALUES (?, ?, ?)",
+                           [(amount, currency, price_id) for amount, price_id in prices.items()])
+
+    def warm(self):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT amount, currency, price_id FROM prices").fetchall()
+        with self._lock:
+            for amount, currency, price_id in rows:
+                self._prices[(amount, currency)] = price_id
+
+    def resolve(self, amount, currency=None):
+        key = (int(amount), currency or self.currency)
+        price_id = self._prices.get(key)
+        if price_id is not None:
+            return price_id
+        # only one thread per worker talks to Stripe for a missing Price, the rest find it cached afterwards, threads
+        # resolving other amounts are not held up
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            price_id = self._prices.get(key)
+            if price_id is None:
+                price_id = self._load(*key) or self._fetch_or_create(*key)
+                with self._lock:
+                    self._prices[key] = price_id
+                    self._key_locks.pop(key, None)
+        return price_id
+
+    def _load(self, amount, currency):
+        with self._connect() as db:
+            row = db.execute("SELECT price_id FROM prices WHERE amount = ? AND currency = ?",
+                             (amount, currency)).fetchone()
+        return row[0] if row else None
+
+    def _fetch_or_create(self, amount, currency):
+        lookup_key = f"{self.product_name.lower()}-{currency}-{amount}"
+        prices = stripe.Price.list(lookup_keys=[lookup_key], active=True, limit=1)
+        if prices.data:
+            price_id = prices.data[0].id
+        else:
+            price_id = stripe.Price.create(unit_amount=amount * 100, currency=currency, product=self._product(),
+                                           lookup_key=lookup_key, idempotency_key=f"price-{lookup_key}").id
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO prices VALUES (?, ?, ?)",
+                       (amount, currency, price_id))
+        return price_id
+
+    def _product(self):
+        with self._product_lock:
+            return self._load_or_create_product()
+
+    def _load_or_create_product(self):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM settings WHERE key = 'product_id'").fetchone()
+        if row:
+            return row[0]
+        product_id = stripe.Product.create(name=self.product_name,
+                                           idempotency_key=f"product-{self.product_name.lower()}").id
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO settings VALUES ('product_id', ?)", (product_id,))
+        return product_id
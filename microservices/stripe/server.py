@@ -13,6 +13,8 @@ from wtforms import StringField, SubmitField, RadioField, SelectField, IntegerFi
 from wtforms.validators import InputRequired, NumberRange, ValidationError
 
 import stripe
+from idempotency import IdempotencyStore, idempotency_key
+from prices import PriceResolver
 # This is a public sample test API key.
 # Don’t submit any personally identifiable information in requests made with this key.
 # Sign in to see your own test API key embedded in code samples.
@@ -56,7 +58,17 @@ category = {
     180: "price_1MkpjYLUyNHnHR56Wiw6mTPN",
     200: "price_1MkluULUyNHnHR56ISQ59eIo"
 }
-id = ""
+
+# Prices for any other amount are created on first use and remembered across restarts
+price_resolver = PriceResolver(os.getenv("PRICE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prices.db")),
+                               currency=os.getenv("PRICE_CURRENCY", "sgd"))
+price_resolver.seed(category)
+price_resolver.warm()
+
+# a retried checkout gets the session created the first time instead of a new one, per worker process, Stripe's own
+# idempotency keys catch the duplicates that land on another worker
+checkout_sessions = IdempotencyStore(
+    ttl=int(os.getenv("CHECKOUT_SESSION_TTL", "1800")))
 
 
 @app.route('/checkout-form', methods=["GET", "POST"])
@@ -71,24 +83,27 @@ def index():
 def cpf():
     form = customForm()
     if form.validate_on_submit():
-        print("bye")
-        # Handle form submission
-        basic_price = int(form.basic.data)
-        premium_price = int(form.premium.data)
-        luxury_price = int(form.luxury.data)
-        if isinstance(form.custom_price.data, str) and form.custom_price.data.isdigit():
-            custom_price = int(form.custom_price.data)
-        else:
-            custom_price = None
-        # Do something with the form data
+        # create the Prices for the picked amounts now, so checkout finds them cached
+        amounts = [form.basic.data, form.premium.data,
+                   form.luxury.data, form.custom_price.data]
+        try:
+            for amount in amounts:
+                if str(amount).isdigit():
+                    price_resolver.resolve(int(amount))
+        except stripe.error.StripeError as e:
+            return jsonify(error=str(e)), 500
         return render_template("base.html")
     return render_template("custom_form.html", form=form)
 
 
 @app.route('/finish-liao',)
 def finish_liao():
-    global id
-    payment_intent = stripe.checkout.Session.retrieve(id).payment_intent
+    # the session is named by the caller, concurrent checkouts must not share it
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify(error="session_id is required"), 400
+    payment_intent = stripe.checkout.Session.retrieve(
+        session_id).payment_intent
     return redirect(YOUR_DOMAIN + '/index.html')
 
 
@@ -102,7 +117,7 @@ def create_checkout_session():
             line_items = []
             for item in json_data['cust_checkout']:
                 line_item = {
-                    'price': category[item['price_id']],
+                    'price': price_resolver.resolve(item['price_id'], item.get('currency')),
                     'quantity': item['quantity']
                 }
                 line_items.append(line_item)
@@ -110,30 +125,54 @@ def create_checkout_session():
             # Extract line items from form data
             print(request.form.get('price_id'))
             line_items = [{
-                'price': category[request.form.get('price_id')],
+                'price': price_resolver.resolve(request.form.get('price_id')),
                 'quantity': request.form.get('quantity')
             }]
 
         # Create Stripe checkout session
-        checkout_session = stripe.checkout.Session.create(
-            line_items=line_items,
-            mode='payment',
-            success_url="http://localhost:8000" + '/index.html',
-            cancel_url=YOUR_DOMAIN + '/stripe_success/success.html',
-            discounts=[{"coupon": "d1LybAG0"}],
-        )
+        def create_session(key=None):
+            return stripe.checkout.Session.create(
+                line_items=line_items,
+                mode='payment',
+                # Stripe fills in the session id, finish-liao looks the payment up by it
+                success_url=YOUR_DOMAIN + '/finish-liao?session_id={CHECKOUT_SESSION_ID}',
+                cancel_url=YOUR_DOMAIN + '/stripe_success/success.html',
+                discounts=[{"coupon": "d1LybAG0"}],
+                idempotency_key=key,
+            )
+
+        # the orchestrator sends the appointment the session pays for, the same appointment gets the same session
+        appointment = request.get_json().get('appointment') if request.is_json else None
+        if appointment:
+            key = idempotency_key(appointment, line_items)
+            checkout_session = checkout_sessions.get_or_create(
+                key, lambda: create_session(key))
+        else:
+            checkout_session = create_session()
         # Return session ID to client
 
     except stripe.error.StripeError as e:
         return jsonify(error=str(e)), 500
-    global id
-    id = checkout_session.id
     if request.is_json:
-        return jsonify(checkout_url=checkout_session.url, id=id)
+        return jsonify(checkout_url=checkout_session.url, id=checkout_session.id)
     # else:
     #     return redirect(checkout_session.url, code=303)
 
 
+@app.route('/prices', methods=['POST'])
+def resolve_prices():
+    """
+    Look up or create the Prices for a list of amounts ahead of checkout.
+    """
+    json_data = request.get_json()
+    try:
+        prices = {str(amount): price_resolver.resolve(amount, json_data.get('currency'))
+                  for amount in json_data['amounts']}
+    except stripe.error.StripeError as e:
+        return jsonify(error=str(e)), 500
+    return jsonify(prices=prices)
+
+
 # @app.route('/stripe_webhooks', methods=['POST'])
 # def webhook():
 #     event = None
@@ -1,5 +1,9 @@
 use anyhow::Result;
-use async_graphql::{http::GraphiQLSource, Context, EmptySubscription, Object, Schema, ID};
+use async_graphql::{
+    extensions::apollo_persisted_queries::{ApolloPersistedQueries, LruCacheStorage},
+    http::GraphiQLSource,
+    Context, EmptySubscription, Object, Schema, ID,
+};
 use async_graphql_axum::{GraphQLRequest, GraphQLResponse};
 use axum::{
     extract::State,
@@ -34,6 +38,8 @@ async fn main() -> Result<()> {
         database.collection::<User>(&std::env::var("COLLECTION").unwrap_or_else(|_| "user".into()));
     let schema = Schema::build(QueryRoot, MutationRoot, EmptySubscription)
         .data(collection)
+        // the orchestrator sends the hash of a document it already sent once instead of its text
+        .extension(ApolloPersistedQueries::new(LruCacheStorage::new(256)))
         .finish();
     let app = Router::new()
         .route("/", get(graphiql).post(graphql_handler))